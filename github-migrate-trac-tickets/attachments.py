@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copy the attachments of a Trac environment into a directory that is
+# published somewhere (e.g. pushed to a GitHub repository), and rewrite the
+# attachment links of tickets and wiki pages to point there.
+#
+# Files are streamed in blocks, so their size does not matter, and stored
+# under their SHA1: identical files are kept once however often they were
+# attached.  Copies run in a bounded pool of threads.
+
+import errno
+import hashlib
+import logging
+import os
+import Queue
+import re
+import tempfile
+import threading
+import urllib
+
+from instrument import stats
+
+BLOCK_SIZE = 1 << 20
+
+
+def attachment_path(env_path, type_, id_, filename):
+    """Return the path of an attachment in a Trac environment, or None.
+
+    Trac 1.0 and later store attachments under hashed names in
+    files/attachments, older versions under quoted names in attachments.
+    """
+    parent = hashlib.sha1(id_.encode('utf-8')).hexdigest()
+    name = hashlib.sha1(filename.encode('utf-8')).hexdigest() + os.path.splitext(filename)[1]
+    path = os.path.join(env_path, 'files', 'attachments', type_, parent[:3], parent, name)
+    if os.path.isfile(path):
+        return path
+    path = os.path.join(env_path, 'attachments', type_,
+                        urllib.quote(id_.encode('utf-8')), urllib.quote(filename.encode('utf-8')))
+    if os.path.isfile(path):
+        return path
+    return None
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _extension(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if re.match(r'^\.\w{1,10}$', ext) else ''
+
+
+def copy_file(source, dest_dir, filename):
+    """Copy source into dest_dir as <sha1[:2]>/<sha1><ext>; return that relative path.
+
+    The file is hashed while it is copied to a temporary file, which is
+    dropped if the same content was stored before.
+    """
+    fd, temp = tempfile.mkstemp(dir=dest_dir, prefix='.incoming-')
+    try:
+        digest = hashlib.sha1()
+        with open(source, 'rb') as infile:
+            with os.fdopen(fd, 'wb') as outfile:
+                for block in iter(lambda: infile.read(BLOCK_SIZE), ''):
+                    digest.update(block)
+                    outfile.write(block)
+        sha1 = digest.hexdigest()
+        relative = os.path.join(sha1[:2], sha1 + _extension(filename))
+        target = os.path.join(dest_dir, relative)
+        if os.path.exists(target):
+            os.remove(temp)
+        else:
+            _makedirs(os.path.dirname(target))
+            os.rename(temp, target)
+        return relative
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def copy_attachments(attachments, env_path, dest_dir, base_url, workers=4):
+    """Copy (type, id, filename, size) attachments; return their AttachmentMapping.
+
+    Missing files are logged and left out of the mapping.
+    """
+    _makedirs(dest_dir)
+    base_url = base_url.rstrip('/')
+    tasks = Queue.Queue(2 * workers)
+    urls = {}
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            type_, id_, filename, size = task
+            source = attachment_path(env_path, type_, id_, filename)
+            if source is None:
+                logging.warn(u'Attachment {0} of {1} {2} is missing'.format(filename, type_, id_))
+                continue
+            try:
+                with stats.timer('attachments', nbytes=size or 0):
+                    relative = copy_file(source, dest_dir, filename)
+            except (IOError, OSError) as e:
+                logging.error(u'Could not copy attachment {0} of {1} {2}: {3}'.format(filename, type_, id_, e))
+                continue
+            with lock:
+                urls[(type_, id_, filename)] = base_url + '/' + relative.replace(os.sep, '/')
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for attachment in attachments:
+        tasks.put(attachment)
+    for thread in threads:
+        tasks.put(None)
+    for thread in threads:
+        thread.join()
+    logging.info('Copied {0} attachments to {1}'.format(len(urls), dest_dir))
+    return AttachmentMapping(urls)
+
+
+class AttachmentMapping(object):
+    """{(type, id, filename): url} of the copied attachments.
+
+    bind(type, id) gives the object the converters use for the text of one
+    ticket or wiki page, where attachment:foo.png means an attachment of
+    that ticket or page.
+    """
+
+    def __init__(self, urls):
+        self.urls = urls
+        self.by_parent = {}
+        for type_, id_, filename in sorted(urls):
+            self.by_parent.setdefault((type_, id_), []).append(filename)
+        digest = hashlib.sha1()
+        for item in sorted(urls.iteritems()):
+            digest.update(repr(item))
+        self.fingerprint = digest.hexdigest()
+
+    def bind(self, type_, id_):
+        return BoundAttachments(self, type_, unicode(id_))
+
+
+class BoundAttachments(object):
+    """Rewrite the attachment links in the text of one ticket or wiki page.
+
+    [[Image(...)]], [attachment:... label] and attachment:... become
+    Markdown images and links.  A target may name another parent, like
+    foo.png:ticket:12 or ticket:12:foo.png in an image.  Links to unknown
+    attachments are left alone.
+
+    Converters call extract() before their other substitutions and
+    restore() after them, so those cannot change the new links.
+    """
+    rx_link = re.compile(
+        r'\[\[Image\((?P<image>[^),]*)(?P<options>[^)]*)\)\]\]'
+        r'|\[attachment:(?P<target>[^\] ]+)(?: (?P<label>[^\]]*))?\]'
+        r'|(?<![\w\[(])attachment:(?P<bare>[^\s\])]+)')
+    rx_image_parent = re.compile(r'^(ticket|wiki):(.+):([^:]+)$')
+    rx_link_parent = re.compile(r'^(.+?):(ticket|wiki):(.+)$')
+    rx_placeholder = re.compile(u'\x00(\\d+)\x00')
+
+    def __init__(self, mapping, type_, id_):
+        self.urls = mapping.urls
+        self.type = type_
+        self.id = id_
+        self.filenames = mapping.by_parent.get((type_, id_), [])
+        self.fingerprint = '%s:%s:%s' % (mapping.fingerprint, type_, id_.encode('utf-8'))
+
+    def url(self, target, image=False):
+        if image:
+            parent = self.rx_image_parent.match(target)
+            if parent:
+                return self.urls.get((parent.group(1), parent.group(2), parent.group(3)))
+        else:
+            parent = self.rx_link_parent.match(target)
+            if parent:
+                return self.urls.get((parent.group(2), parent.group(3), parent.group(1)))
+        return self.urls.get((self.type, self.id, target))
+
+    def _link(self, match):
+        if match.group('image') is not None:
+            target = match.group('image').strip()
+            url = self.url(target, image=True)
+            if url is None:
+                return None
+            return u'![{0}]({1})'.format(target.split(':')[-1], url)
+        target = match.group('target') or match.group('bare')
+        trailer = u''
+        url = self.url(target)
+        if url is None and match.group('bare'):
+            # Punctuation after a bare link is not part of it
+            stripped = target.rstrip(u'.,;:!?')
+            trailer = target[len(stripped):]
+            target = stripped
+            url = self.url(target)
+        if url is None:
+            return None
+        label = match.group('label') or target.split(':')[0]
+        return u'[{0}]({1}){2}'.format(label, url, trailer)
+
+    def extract(self, text):
+        """Replace the attachment links by placeholders; return (text, links)."""
+        links = []
+        if 'ttachment:' not in text and '[[Image(' not in text:
+            return text, links
+
+        def sub(match):
+            link = self._link(match)
+            if link is None:
+                return match.group(0)
+            links.append(link)
+            return u'\x00%d\x00' % (len(links) - 1)
+        return self.rx_link.sub(sub, text), links
+
+    def restore(self, text, links):
+        """Put the links taken by extract() back into the converted text."""
+        if not links:
+            return text
+        return self.rx_placeholder.sub(lambda match: links[int(match.group(1))], text)
+
+    def links(self):
+        """Markdown links to all attachments of the ticket or page."""
+        return [u'[{0}]({1})'.format(filename, self.urls[(self.type, self.id, filename)])
+                for filename in self.filenames]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Map Trac usernames to GitHub logins and mail addresses.
+
+import re
+
+
+class AuthorMapping(object):
+    """Take provided file and return author mapping object
+
+    Lines are "trac_user = github_login" or, for the commits of the wiki,
+    "trac_user = Name <mail>"; "trac_user = " leaves the user unmapped.
+    The name of a wiki author is only used as the GitHub login of tickets
+    if it is a valid login.  Lookups are memoized; resolve() fills the
+    table for all users up front.
+    """
+    rx_line = re.compile(r'^([\(\w\s\@&\.\d]*) = (?:([\w-]*)|([\(\d\w -]*?) <(.*)>)$')
+    rx_login = re.compile(r'^[\w-]+$')
+
+    def __init__(self, map_file):
+        self.mapping = {}
+        self.resolved = {}
+        if map_file:
+            with open(map_file, 'r') as file_:
+                for line in file_:
+                    if not line.strip():
+                        continue
+                    match = self.rx_line.search(line)
+                    if not match:
+                        raise ValueError, 'Author line not in correct format: "%s"' % line
+                    svn_user, login, name, email = match.groups()
+                    if login is None:
+                        name = name.strip()
+                        login = name if self.rx_login.match(name) else "None"
+                    else:
+                        login = name = login or "None"
+                    self.mapping[svn_user.strip()] = {"login": login, "name": name,
+                                                      "mail": email.strip() if email else "None"}
+
+    def _lookup(self, username):
+        if not self.mapping:
+                return {"login" : username, "name": username, "mail": "None"}
+        # just take 1st user if given a list
+        username = username.split(',')[0].strip()
+        if not username in self.mapping:
+        #    print "%s = DMWMBot <USER@DOMAIN>" % username
+            return {"login" : "None", "name": "None", "mail": "None"}
+        # Throw if author not in mapping
+        return self.mapping[username]
+
+    def resolve(self, usernames, field="login"):
+        """Look up all usernames at once; return the sorted list of those without a field."""
+        unmapped = set()
+        for username in usernames:
+            self.resolved[username] = author = self._lookup(username)
+            if self.mapping and author[field] == "None":
+                unmapped.add(username.split(',')[0].strip())
+        return sorted(unmapped)
+
+    def __call__(self, username):
+        try:
+            return self.resolved[username]
+        except KeyError:
+            author = self.resolved[username] = self._lookup(username)
+            return author
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# End-to-end benchmark of the migration scripts on synthetic Trac databases
+# (see synthetic-trac-db.py).  Every stage runs as its own process; its wall
+# time, CPU time and peak resident memory are taken from the rusage of that
+# process alone.  Nothing talks to GitHub: tickets are dumped with --json.
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(args, cwd=None):
+    """Run a command; return (exit status, wall seconds, cpu seconds, peak RSS in MB)."""
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        process = subprocess.Popen(args, cwd=cwd, stdout=devnull, stderr=subprocess.PIPE)
+        # Read stderr first so a chatty process cannot block on a full pipe
+        errors = process.stderr.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.time() - start
+    process.returncode = status
+    if status:
+        logging.error('{0} failed:\n{1}'.format(' '.join(args), errors[-2000:]))
+    # ru_maxrss is in kB on Linux and in bytes on OS X
+    rss = usage.ru_maxrss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+    return status, wall, usage.ru_utime + usage.ru_stime, rss
+
+
+def count(db, query):
+    import sqlite3
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(query).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def benchmark(size, workdir, options):
+    """Generate a database with size tickets and time each stage on it."""
+    python = sys.executable
+    db = os.path.join(workdir, 'trac-{0}.db'.format(size))
+    revmap_args = ['--repo-names', 'main', '--repo-types', 'svn', '--revmap-files', db + '.revmap']
+    results = []
+
+    def stage(name, args, items, unit, cwd=None):
+        status, wall, cpu, rss = run(args, cwd=cwd)
+        result = {
+            'tickets': size, 'stage': name, 'ok': status == 0, 'seconds': wall, 'cpu': cpu,
+            'peak_rss_mb': rss, 'items': items, 'unit': unit, 'per_second': items / wall if wall else 0.0,
+        }
+        results.append(result)
+        logging.info('{0:>7} tickets {1:<18} {2:8.2f}s {3:10.0f} {4}/s {5:8.1f} MB{6}'.format(
+            size, name, wall, result['per_second'], unit, rss, '' if status == 0 else '  FAILED'))
+        return status == 0
+
+    if not stage('generate', [python, os.path.join(HERE, 'synthetic-trac-db.py'), '--tickets', str(size),
+                              '--seed', str(options.seed), db], size, 'tickets'):
+        return results
+    revisions = sum(1 for _ in open(db + '.revmap'))
+    comments = count(db, "SELECT COUNT(*) FROM ticket_change WHERE field='comment'")
+    versions = count(db, 'SELECT COUNT(*) FROM wiki')
+
+    stage('revmap-index', [python, '-c', 'import sys, revmap; revmap.RevisionIndex.load(sys.argv[1])',
+                           db + '.revmap'], revisions, 'revisions', cwd=HERE)
+
+    tickets_args = [python, os.path.join(HERE, 'trac-tickets-to-gh.py'), '-q', '--json',
+                    '--json-format', options.json_format, '--jobs', str(options.jobs),
+                    '--authors-file', db + '.authors'] + revmap_args
+    cache = os.path.join(workdir, 'cache-{0}.db'.format(size))
+    passes = [('tickets', [])]
+    if options.cache:
+        passes = [('tickets-cold-cache', ['--cache', cache]), ('tickets-warm-cache', ['--cache', cache])]
+    for name, extra in passes:
+        out = os.path.join(workdir, 'out-{0}-{1}'.format(size, name), 'org', 'repo')
+        stage(name, tickets_args + extra + [db, 'user', out], size + comments, 'tickets+comments')
+
+    if not options.no_wiki:
+        wiki_repo = os.path.join(workdir, 'wiki-{0}'.format(size))
+        subprocess.check_call(['git', 'init', '-q', wiki_repo])
+        stage('wiki', [python, os.path.join(HERE, 'wiki-to-gh.py'), '-q', '--fast-import',
+                       '--jobs', str(options.jobs), '--authors-file', db + '.wiki-authors'] + revmap_args + [db, wiki_repo],
+              versions, 'versions')
+    return results
+
+
+if __name__ == '__main__':
+    usage = """
+      %prog [options]
+
+      Times every migration stage on synthetic databases of each size and
+      prints wall time, throughput and peak memory per stage.
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-s', '--sizes', default='1000,10000,100000',
+                      help='Comma separated numbers of tickets (default: 1000,10000,100000)')
+    parser.add_option('--jobs', type='int', default=1,
+                      help='Passed to trac-tickets-to-gh.py and wiki-to-gh.py (default: 1)')
+    parser.add_option('--json-format', type='choice', choices=['files', 'ndjson', 'tar'], default='files',
+                      help='Passed to trac-tickets-to-gh.py (default: files)')
+    parser.add_option('--cache', action='store_true', default=False,
+                      help='Run the tickets twice with a --cache, cold and warm (default: false)')
+    parser.add_option('--no-wiki', action='store_true', default=False,
+                      help='Skip the wiki-to-gh.py stage (default: false)')
+    parser.add_option('--seed', type='int', default=0,
+                      help='Seed for synthetic-trac-db.py (default: 0)')
+    parser.add_option('--workdir', default=None,
+                      help='Keep databases and output in this directory (default: a temporary one, removed afterwards)')
+    parser.add_option('-o', '--output', default=None,
+                      help='Also write the results as json to this file')
+    (options, args) = parser.parse_args()
+    if args:
+        parser.error('Wrong number of arguments')
+    logging.basicConfig(level=logging.INFO, format='%(levelname)9s: %(message)s')
+
+    workdir = options.workdir or tempfile.mkdtemp(prefix='trac-benchmark-')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    results = []
+    try:
+        for size in options.sizes.split(','):
+            results.extend(benchmark(int(size), workdir, options))
+    finally:
+        if not options.workdir:
+            shutil.rmtree(workdir)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if all(r['ok'] for r in results) else 1)
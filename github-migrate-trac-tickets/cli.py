@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# Command line of the migration: trac-migrate.py runs the ticket and the wiki
+# migration, or both in one process; trac-tickets-to-gh.py and wiki-to-gh.py
+# run one of them.  The Trac database, the author and revision maps and the
+# conversion cache are opened once and shared by both.  The options of all
+# commands are defined here, so that parsing them loads neither the ticket nor
+# the wiki migration, nor the GitHub client.
+
+import logging
+import re
+from optparse import OptionParser
+
+from authors import AuthorMapping
+from instrument import stats
+from revmap import Repository, RevisionMapping
+from trac import TicketFilter, open_trac, parse_date
+
+USAGE = """
+      %prog [options] tickets trac_db_path github_username github_repo
+      %prog [options] wiki trac_db_path wiki_repo_path
+      %prog [options] all trac_db_path github_username github_repo wiki_repo_path
+
+      The path might be something like "/tmp/trac.db", or a plain MySQL dump like "/tmp/trac.sql[.gz]"
+      The github_repo combines user or organization and specific repo like "myorg/myapp"
+      The wiki_repo_path is a clone of the wiki repository of the GitHub project.
+
+      To test on local machines, use --json flag and give fake github username and repository path.
+      You must delete the target path if it already exists.
+    """
+
+# The arguments of each command
+ARGUMENTS = {
+    'tickets': ['trac_db_path', 'github_username', 'github_repo'],
+    'wiki': ['trac_db_path', 'wiki_repo_path'],
+    'all': ['trac_db_path', 'github_username', 'github_repo', 'wiki_repo_path'],
+}
+
+
+def add_options(parser):
+    """Add the options shared by the ticket and the wiki migration."""
+    parser.add_option('-q', '--quiet', action='store_true', default=False,
+                      help='Decrease logging of activity (default: false)')
+    parser.add_option('--authors-file', default=None,
+                      help='Author mapping file, if not specified take usernames from trac as given')
+    parser.add_option('--revmap-files', default=None,
+                      help='Comma-separated list of revision mapping files')
+    parser.add_option('--repo-types', default=None,
+                      help='Comma-separated list of repository types')
+    parser.add_option('--repo-names', default=None,
+                      help='Comma-separated list of repository names (empty string means the default one)')
+    parser.add_option('--index-copy', action='store_true', default=False,
+                      help='Query an indexed temporary copy of the Trac database (default: query it as it is)')
+    parser.add_option('--db-cache-size', type='int', default=64,
+                      help='Page cache of the Trac database in MB (default: 64)')
+    parser.add_option('--db-mmap-size', type='int', default=256,
+                      help='How much of the Trac database to memory map in MB, 0 to read it instead (default: 256)')
+    parser.add_option('--trac-env', default=None,
+                      help='Trac environment directory to copy attachments from (default: attachments are not migrated)')
+    parser.add_option('--attachments-dir', default='attachments',
+                      help='Directory the attachments are copied to (default: attachments)')
+    parser.add_option('--attachments-url', default=None,
+                      help='URL the attachments directory is published at, required with --trac-env')
+    parser.add_option('--attachment-workers', type='int', default=4,
+                      help='Number of threads copying attachments (default: 4)')
+    parser.add_option('--cache', default=None,
+                      help='Cache converted texts in this SQLite file across runs (default: no cache)')
+    parser.add_option('--cache-size', type='int', default=512,
+                      help='Maximum size of the conversion cache in MB (default: 512)')
+    parser.add_option('--jobs', type='int', default=1,
+                      help='Number of worker processes converting tickets and page versions (default: 1)')
+    parser.add_option('--profile', default=None,
+                      help='Write a cProfile dump to PROFILE.pstats and the phase statistics to PROFILE.json (default: none)')
+    parser.add_option('-y', '--dry-run', action='store_true', default=False,
+                      help='Do not actually post to GitHub, but only show the conversion result. (default: false)')
+
+
+def add_ticket_options(parser):
+    """Add the options of the ticket migration."""
+    parser.add_option('-c', '--component', default=None,
+                      help='Component to migrate (default: all)')
+    parser.add_option('--ids', default=None,
+                      help='Range of ticket ids to migrate like 100-199, 100- or -199 (default: all)')
+    parser.add_option('--status', default=None,
+                      help='Comma-separated list of ticket statuses to migrate (default: all)')
+    parser.add_option('--changed-after', default=None,
+                      help='Only migrate tickets changed at or after this YYYY-MM-DD[THH:MM] local time (default: all)')
+    parser.add_option('--changed-before', default=None,
+                      help='Only migrate tickets changed before this YYYY-MM-DD[THH:MM] local time (default: all)')
+    parser.add_option('--shard', default=None,
+                      help='Export only shard I/N with --json: the I-th of N id ranges with equally many of the selected tickets, '
+                           'so N processes can export a large Trac at once (default: all)')
+    parser.add_option('-j', '--json', action='store_true', default=False,
+                      help='Output to json files for github import (default: direct upload)')
+    parser.add_option('--json-format', type='choice', choices=['files', 'ndjson', 'tar'], default='files',
+                      help='With --json, write one file per object (files), or stream everything into '
+                           'github_repo.ndjson or github_repo.tar (default: files)')
+    parser.add_option('--gzip', action='store_true', default=False,
+                      help='Compress the --json-format ndjson or tar output (default: false)')
+    parser.add_option('--github-api', default=None,
+                      help='GitHub API URL (default: https://api.github.com)')
+    parser.add_option('--concurrency', type='int', default=4,
+                      help='Maximum number of concurrent GitHub requests (default: 4)')
+    parser.add_option('--import-api', action='store_true', default=False,
+                      help="Create issues with GitHub's issue import API, one request per issue with its comments, "
+                           'creation time and closed state (default: create and close them with the issues API)')
+    parser.add_option('--import-window', type='int', default=50,
+                      help='Maximum number of issue imports GitHub is still working on, with --import-api (default: 50)')
+    parser.add_option('--first-issue-number', type='int', default=None,
+                      help='Number of the first created issue, for rewriting ticket references (default: asked from GitHub)')
+    parser.add_option('--comments', type='choice', choices=['body', 'separate'], default='body',
+                      help='Quote the comments and field changes of a ticket in the issue body (body), or make each '
+                           'one a comment with its original author and time (separate) (default: body)')
+    parser.add_option('--no-history', action='store_false', dest='history', default=True,
+                      help='Only migrate the comments of tickets, not the changes of their fields (default: migrate both)')
+    parser.add_option('--journal', default=None,
+                      help='Record completed steps in this SQLite file and skip them when run again; '
+                           'only read in a dry run (default: none)')
+
+
+def check_ticket_options(parser, options):
+    """Check the ticket options; sets options.selection and options.shards."""
+    first_id = last_id = None
+    if options.ids:
+        match = re.match(r'^(\d*)-(\d*)$', options.ids)
+        if not match:
+            parser.error('Ticket id range must be like 100-199, 100- or -199. (--ids)')
+        first_id = int(match.group(1)) if match.group(1) else None
+        last_id = int(match.group(2)) if match.group(2) else None
+    try:
+        changed_after = options.changed_after and parse_date(options.changed_after)
+        changed_before = options.changed_before and parse_date(options.changed_before)
+    except ValueError as e:
+        parser.error(str(e))
+    if options.shard:
+        match = re.match(r'^(\d+)/(\d+)$', options.shard)
+        if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+            parser.error('Shard must be like 2/4, for the second of four shards. (--shard)')
+        if not options.json:
+            parser.error('GitHub numbers issues in the order they are created, so only --json exports can be sharded. (--shard)')
+        if not options.first_issue_number:
+            parser.error('All shards must plan the same issue numbers. (--first-issue-number)')
+        options.shards = int(match.group(1)), int(match.group(2))
+    else:
+        options.shards = None
+    if options.import_api and options.json:
+        parser.error('The issue import API uploads to GitHub; leave out --json. (--import-api)')
+    options.selection = TicketFilter(options.component, first_id, last_id,
+                                     options.status and options.status.split(','), changed_after, changed_before)
+
+
+def add_wiki_options(parser):
+    """Add the options of the wiki migration."""
+    parser.add_option('--fast-import', action='store_true', default=False,
+                      help='Write all page versions through one git fast-import process (default: git add/commit per version)')
+    parser.add_option('--state-file', default=None,
+                      help='File recording the last migrated page version (default: trac-wiki-state.json in the git directory of the wiki repository)')
+    parser.add_option('--from-start', action='store_true', default=False,
+                      help='Migrate all page versions again, not only those after the recorded one (default: false)')
+
+
+# Warning: optparse is deprecated in python-2.7 in favor of argparse
+def main(command=None, usage=USAGE):
+    """Run command, one of ARGUMENTS, or the one given as first argument."""
+    parser = OptionParser(usage=usage)
+    add_options(parser)
+    add_ticket_options(parser)
+    add_wiki_options(parser)
+
+    (options, args) = parser.parse_args()
+    if command is None:
+        if not args or args[0] not in ARGUMENTS:
+            parser.error('The command must be one of tickets, wiki or all')
+        command, args = args[0], args[1:]
+    if len(args) != len(ARGUMENTS[command]):
+        parser.error('Wrong number of arguments')
+    arguments = dict(zip(ARGUMENTS[command], args))
+    if 'github_repo' in arguments and not '/' in arguments['github_repo']:
+        parser.error('Repo must be specified like "organization/project"')
+
+    if options.quiet:
+        logging.basicConfig(level=logging.INFO, format='%(levelname)9s: %(message)s')
+    else:
+        logging.basicConfig(level=logging.DEBUG, format='%(levelname)9s: %(message)s')
+
+    if not options.revmap_files:
+        parser.error('You must specify at least one revision mapping file. (--revmap-files)')
+    if not options.repo_types:
+        parser.error('You must specify at least one source repo type. (--repo-types)')
+    if not options.repo_names:
+        parser.error('You must specify at least one source repo name. (--repo-names)')
+    if options.trac_env and not options.attachments_url:
+        parser.error('You must specify where the attachments are published. (--attachments-url)')
+    if command != 'wiki':
+        check_ticket_options(parser, options)
+    options.revmap_files = options.revmap_files.split(',')
+    options.repo_names = options.repo_names.split(',')
+    options.repo_types = options.repo_types.split(',')
+    assert len(options.repo_names) == len(options.repo_types)
+    assert len(options.repo_names) == len(options.revmap_files)
+    repo_list = []
+    for i, name in enumerate(options.repo_names):
+        repo_list.append(Repository(name, options.repo_types[i], options.revmap_files[i]))
+
+    if options.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    trac = open_trac(arguments['trac_db_path'], index_copy=options.index_copy,
+                     cache_bytes=options.db_cache_size * 1024 * 1024, mmap_bytes=options.db_mmap_size * 1024 * 1024)
+    # default to no mapping
+    author_mapping = AuthorMapping(options.authors_file)
+    rev_mapping = RevisionMapping(repo_list)
+    cache = None
+    if options.cache:
+        from convcache import ConversionCache
+        cache = ConversionCache(options.cache, max_bytes=options.cache_size * 1024 * 1024)
+
+    stages = ['tickets', 'wiki'] if command == 'all' else [command]
+    # The issue numbers of the tickets, for the references in wiki pages
+    ticket_mapping = None
+    for stage in stages:
+        # Each stage loads its modules (and those of GitHub or git) only when it runs
+        if stage == 'tickets':
+            import tickets
+            ticket_mapping = tickets.migrate(options, trac, author_mapping, rev_mapping,
+                                             arguments['github_username'], arguments['github_repo'], cache=cache)
+        else:
+            import wiki
+            wiki.migrate(options, trac, author_mapping, rev_mapping, arguments['wiki_repo_path'], cache=cache,
+                         ticket_mapping=ticket_mapping)
+        if len(stages) > 1:
+            # Both stages have read and convert phases; report them apart
+            logging.info('Migrated the {0}'.format(stage))
+            stats.report()
+            if options.profile:
+                stats.dump('{0}.{1}.json'.format(options.profile, stage))
+            stats.take()
+
+    trac.close()
+    if cache is not None:
+        cache.close()
+
+    if len(stages) == 1:
+        stats.report()
+    if options.profile:
+        profiler.disable()
+        profiler.dump_stats(options.profile + '.pstats')
+        if len(stages) == 1:
+            stats.dump(options.profile + '.json')
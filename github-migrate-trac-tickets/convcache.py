@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Persistent cache of wiki markup conversions, so repeated migration runs
+# only convert the texts (or settings) that changed since the last run.
+
+import hashlib
+import multiprocessing.util
+import os
+import sqlite3
+import time
+
+import wikiformat
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ConversionCache(object):
+    """Key/value store in an SQLite file, evicting least recently used entries.
+
+    Each process opens its own connection, so a cache can be shared by
+    forked worker processes.  New entries and the use times of hits are
+    collected and written in one transaction per flush_every of them, and
+    when the cache is closed or the (worker) process exits; the database
+    runs in WAL mode without fsync, as losing the cache only costs time.
+    """
+    flush_every = 500
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._pid = None
+        self._size = None
+        # key: value of the entries not written yet
+        self._new = {}
+        # key: use time of the hits not written yet
+        self._used = {}
+
+    @property
+    def conn(self):
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._conn.text_factory = unicode
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=OFF')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS conversion '
+                               '(key TEXT PRIMARY KEY, value TEXT, size INTEGER, used REAL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS conversion_used ON conversion (used)')
+            self._pid = os.getpid()
+            self._size = None
+            # What a forked process inherited is written by its parent
+            self._new = {}
+            self._used = {}
+            multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+        return self._conn
+
+    def size(self):
+        """Total size of the cached values in bytes."""
+        (size,), = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM conversion')
+        return size
+
+    def get(self, key):
+        conn = self.conn
+        if key in self._new:
+            return self._new[key]
+        row = conn.execute('SELECT value FROM conversion WHERE key=?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._used[key] = time.time()
+        if len(self._new) + len(self._used) >= self.flush_every:
+            self.flush()
+        return row[0]
+
+    def put(self, key, value):
+        self.conn
+        self._new[key] = value
+        if len(self._new) + len(self._used) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write the collected entries and use times in one transaction."""
+        if self._pid != os.getpid() or not (self._new or self._used):
+            return
+        new, self._new = self._new, {}
+        used, self._used = self._used, {}
+        now = time.time()
+        rows = [(key, value, len(value.encode('utf-8')), now) for key, value in new.iteritems()]
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Replaced entries no longer count
+            replaced = 0
+            keys = new.keys()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                (size,), = conn.execute('SELECT COALESCE(SUM(size), 0) FROM conversion WHERE key IN (%s)' %
+                                        ', '.join('?' * len(chunk)), chunk)
+                replaced += size
+            conn.executemany('INSERT OR REPLACE INTO conversion (key, value, size, used) VALUES (?, ?, ?, ?)', rows)
+            conn.executemany('UPDATE conversion SET used=? WHERE key=?', ((t, key) for key, t in used.iteritems()))
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += sum(row[2] for row in rows) - replaced
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache is below 90% of max_bytes."""
+        target = self.max_bytes * 9 // 10
+        size = self.size()
+        while size > target:
+            deleted = self.conn.execute(
+                'DELETE FROM conversion WHERE key IN '
+                '(SELECT key FROM conversion ORDER BY used LIMIT 1000)').rowcount
+            if not deleted:
+                break
+            size = self.size()
+        self._size = size
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self.flush()
+            self._conn.close()
+        self._conn = None
+        self._pid = None
+
+
+class CachedConverter(object):
+    """Wrap a wikiformat converter so its results are looked up in a ConversionCache.
+
+    The key covers the text, the converter flavour and version, the flags,
+    the revision maps, the ticket numbers and the attachments, so a change
+    to any of them misses the cache.
+    """
+
+    def __init__(self, converter, cache):
+        self.converter = converter
+        self.cache = cache
+        self.prefix = '%s:%d:' % (converter.name, wikiformat.VERSION)
+
+    def key(self, text, rev_mapping, title, mainpage, ticket_mapping=None, attachments=None):
+        digest = hashlib.sha1(self.prefix)
+        fingerprint = rev_mapping.fingerprint if rev_mapping is not None else ''
+        digest.update('%s:%d:%d:' % (fingerprint, title, mainpage))
+        if ticket_mapping is not None:
+            digest.update('tickets:%s:' % ticket_mapping.fingerprint)
+        if attachments is not None:
+            digest.update('attachments:%s:' % attachments.fingerprint)
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def __call__(self, text, rev_mapping=None, title=False, mainpage=False, ticket_mapping=None,
+                 attachments=None):
+        key = self.key(text, rev_mapping, title, mainpage, ticket_mapping, attachments)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.converter(text, rev_mapping=rev_mapping, title=title, mainpage=mainpage,
+                                    ticket_mapping=ticket_mapping, attachments=attachments)
+            self.cache.put(key, result)
+        return result
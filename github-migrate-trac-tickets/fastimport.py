@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Write commits into a git repository through a single `git fast-import`
+# process, instead of spawning `git add` and `git commit` for every file.
+# See git-fast-import(1) for the stream format.
+
+import logging
+import subprocess
+import time
+from datetime import datetime
+
+
+def git_output(repo_path, *args):
+    """Run a git command in repo_path and return its stripped output, or None on failure."""
+    p = subprocess.Popen(('git',) + args, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = p.communicate()
+    if p.returncode != 0:
+        return None
+    return out.strip()
+
+
+def git_date(epoch):
+    """Format epoch seconds as '<epoch> <+hhmm>' in the local timezone.
+
+    This is what `git commit --date=<local iso time>` records, which is how
+    the commits were dated before.
+    """
+    epoch = int(epoch)
+    offset = datetime.fromtimestamp(epoch) - datetime.utcfromtimestamp(epoch)
+    minutes = (offset.days * 86400 + offset.seconds) // 60
+    sign = '-' if minutes < 0 else '+'
+    return '%d %s%02d%02d' % (epoch, sign, abs(minutes) // 60, abs(minutes) % 60)
+
+
+def cleanup_message(message):
+    """Clean up a commit message like `git commit --cleanup=whitespace` does.
+
+    Trailing whitespace is removed from every line, runs of empty lines are
+    collapsed and leading/trailing empty lines are dropped.
+    """
+    lines = []
+    for line in message.splitlines():
+        line = line.rstrip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    while lines and not lines[-1]:
+        lines.pop()
+    if not lines:
+        return u''
+    return u'\n'.join(lines) + u'\n'
+
+
+def _bytes(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+
+class FastImport(object):
+    """Stream file versions as commits on the checked out branch of repo_path.
+
+    Commits continue the current history of the branch, and the working tree
+    is reset to the new head by close().
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.ref = git_output(repo_path, 'symbolic-ref', '-q', 'HEAD') or 'refs/heads/master'
+        self.parent = git_output(repo_path, 'rev-parse', '-q', '--verify', 'HEAD')
+        ident = git_output(repo_path, 'var', 'GIT_COMMITTER_IDENT')
+        if ident is None:
+            raise RuntimeError('Could not determine the git committer identity in %s' % repo_path)
+        # "Name <email> epoch tz"; the date is taken at commit time
+        self.committer = ident[:ident.rindex('>') + 1]
+        self.commits = 0
+        self.process = subprocess.Popen(['git', 'fast-import', '--quiet', '--date-format=raw'],
+                                        cwd=repo_path, stdin=subprocess.PIPE)
+        self.stream = self.process.stdin
+
+    def _data(self, payload):
+        self.stream.write('data %d\n' % len(payload))
+        self.stream.write(payload)
+        self.stream.write('\n')
+
+    def commit(self, path, content, author_name, author_mail, when, message):
+        """Commit content as the new version of path, authored at epoch when."""
+        write = self.stream.write
+        write('commit %s\n' % self.ref)
+        write(_bytes(u'author %s <%s> %s\n' % (author_name, author_mail, git_date(when))))
+        write('committer %s %s\n' % (self.committer, git_date(time.time())))
+        self._data(_bytes(cleanup_message(message)))
+        if self.commits == 0 and self.parent:
+            write('from %s\n' % self.parent)
+        write(_bytes(u'M 100644 inline %s\n' % path))
+        self._data(_bytes(content))
+        self.commits += 1
+
+    def close(self):
+        """Finish the import and update the working tree to the new commits."""
+        self.stream.close()
+        if self.process.wait() != 0:
+            raise RuntimeError('git fast-import failed in %s' % self.repo_path)
+        logging.info('Imported {0} commits into {1}'.format(self.commits, self.ref))
+        if self.commits and git_output(self.repo_path, 'reset', '-q', '--hard') is None:
+            logging.warn('Could not update the working tree of {0}'.format(self.repo_path))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Imitate the parts of the GitHub API the ticket migration uses, for trying
+# out a migration locally with --github-api http://localhost:PORT.
+#
+# Labels, milestones, issues and their comments are kept in memory, and so
+# are issue imports: these are imported in the order they were submitted,
+# after --import-delay seconds, like GitHub does in the background.  On exit
+# (Ctrl-C or SIGTERM) everything is written to --dump as JSON.
+#
+# Lists are paginated with Link headers like GitHub's, and errors can be
+# injected to exercise the retries: every --fail-every'th request answers
+# 502, before or (--fail-after) after it took effect, and every
+# --rate-limit-every'th one answers with a secondary rate limit.
+
+import BaseHTTPServer
+import json
+import logging
+import re
+import signal
+import SocketServer
+import sys
+import threading
+import time
+import urllib
+import urlparse
+from optparse import OptionParser
+
+
+class Repository(object):
+    """The state of the repositories served, guarded by one lock."""
+
+    def __init__(self, import_delay, fail_every=0, fail_after=False, rate_limit_every=0, retry_after=1):
+        self.import_delay = import_delay
+        self.fail_every = fail_every
+        self.fail_after = fail_after
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.labels = []
+        self.milestones = []
+        self.issues = []
+        self.comments = {}
+        self.imports = []
+        self.requests = 0
+        self.injected = {'failed': 0, 'rate_limited': 0}
+
+    def import_due(self):
+        """Import the pending imports that were submitted long enough ago, in order."""
+        now = time.time()
+        for import_ in self.imports:
+            if import_['status'] != 'pending':
+                continue
+            if import_['submitted'] + self.import_delay > now:
+                break
+            issue = import_.pop('request')
+            if not issue['issue'].get('title'):
+                import_['status'] = 'failed'
+                import_['errors'] = [{'resource': 'Issue', 'field': 'title', 'code': 'missing_field'}]
+                continue
+            number = len(self.issues) + 1
+            self.issues.append(dict(issue['issue'], number=number,
+                                    state='closed' if issue['issue'].get('closed') else 'open'))
+            self.comments[number] = list(issue.get('comments', []))
+            import_['status'] = 'imported'
+            import_['issue_url'] = '{0}/issues/{1}'.format(import_['repository_url'], number)
+
+    def dump(self):
+        return {'labels': self.labels, 'milestones': self.milestones, 'issues': self.issues,
+                'comments': self.comments, 'imports': self.imports, 'requests': self.requests,
+                'injected': self.injected}
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send every answer in one piece, see answer()
+    wbufsize = -1
+    rx_path = re.compile(r'^/repos/([^/]+/[^/]+)/(labels|milestones|issues|import/issues)(?:/(\d+))?(/comments)?$')
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def answer(self, status, data, headers={}):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Remaining', '5000')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def handle_request(self, method):
+        repository = self.server.repository
+        length = int(self.headers.get('content-length') or 0)
+        data = json.loads(self.rfile.read(length)) if length else None
+        path, _, query = self.path.partition('?')
+        query = dict(urlparse.parse_qsl(query))
+        with repository.lock:
+            repository.requests += 1
+            if repository.rate_limit_every and repository.requests % repository.rate_limit_every == 0:
+                repository.injected['rate_limited'] += 1
+                return self.answer(403, {'message': 'You have exceeded a secondary rate limit.'},
+                                   {'Retry-After': str(repository.retry_after)})
+            fail = repository.fail_every and repository.requests % repository.fail_every == 0
+            if fail and not repository.fail_after:
+                repository.injected['failed'] += 1
+                return self.answer(502, {'message': 'Server Error'})
+            status, data = self.route(repository, method, path, query, data)
+            if fail:
+                repository.injected['failed'] += 1
+                return self.answer(502, {'message': 'Server Error'})
+        if method == 'GET' and isinstance(data, list):
+            return self.answer(status, *self.paginate(path, query, data))
+        return self.answer(status, data)
+
+    def paginate(self, path, query, items):
+        """Return the page of items query asks for and its Link header, like GitHub."""
+        per_page = min(int(query.get('per_page', 30)), 100)
+        page = int(query.get('page', 1))
+        last = max(1, (len(items) + per_page - 1) // per_page)
+        links = []
+        for rel, number in (('next', page + 1), ('last', last)):
+            if page < last:
+                url = 'http://{0}:{1}{2}?{3}'.format(self.server.server_name, self.server.server_port, path,
+                                                     urllib.urlencode(sorted(dict(query, page=number).items())))
+                links.append('<{0}>; rel="{1}"'.format(url, rel))
+        return items[(page - 1) * per_page:page * per_page], {'Link': ', '.join(links)} if links else {}
+
+    def route(self, repository, method, path, query, data):
+        """Carry out a request; return (status, answer)."""
+        match = self.rx_path.match(path)
+        if not match:
+            return 404, {'message': 'Not Found'}
+        repo, kind, number, comments = match.groups()
+        number = number and int(number)
+        repository.import_due()
+        if kind == 'labels':
+            if method == 'GET':
+                return 200, repository.labels
+            if any(label['name'] == data['name'] for label in repository.labels):
+                return 422, {'message': 'Validation Failed', 'errors': [{'code': 'already_exists'}]}
+            repository.labels.append(data)
+            return 201, data
+        if kind == 'milestones':
+            if method == 'GET':
+                state = query.get('state', 'open')
+                return 200, [m for m in repository.milestones if state in ('all', m.get('state', 'open'))]
+            data['number'] = len(repository.milestones) + 1
+            repository.milestones.append(data)
+            return 201, data
+        if kind == 'import/issues':
+            if 'golden-comet-preview' not in self.headers.get('accept', ''):
+                return 415, {'message': 'The issue import API is a preview; ask for it in Accept'}
+            if method == 'GET':
+                if not number or number > len(repository.imports):
+                    return 404, {'message': 'Not Found'}
+                import_ = repository.imports[number - 1]
+                return 200, dict((k, v) for k, v in import_.items() if k != 'submitted')
+            import_ = {'id': len(repository.imports) + 1, 'status': 'pending', 'submitted': time.time(),
+                       'repository_url': 'http://{0}:{1}/repos/{2}'.format(
+                           self.server.server_name, self.server.server_port, repo),
+                       'request': data}
+            repository.imports.append(import_)
+            return 202, {'id': import_['id'], 'status': 'pending'}
+        if number and number > len(repository.issues):
+            return 404, {'message': 'Not Found'}
+        if comments:
+            if method == 'GET':
+                return 200, repository.comments.get(number, [])
+            repository.comments.setdefault(number, []).append(data)
+            return 201, data
+        if method == 'GET':
+            if number:
+                return 200, repository.issues[number - 1]
+            # Issues are created in number order, so sort=created is by number
+            state = query.get('state', 'open')
+            issues = [i for i in repository.issues if state in ('all', i.get('state', 'open'))]
+            return 200, issues[::-1] if query.get('direction', 'desc') == 'desc' else issues
+        if method == 'PATCH':
+            repository.issues[number - 1].update(data)
+            return 200, repository.issues[number - 1]
+        data['number'] = len(repository.issues) + 1
+        repository.issues.append(data)
+        return 201, data
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PATCH(self):
+        self.handle_request('PATCH')
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    usage = """
+      %prog [options] port
+
+      Serves one GitHub repository, whatever its name, at http://localhost:port
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('--import-delay', type='float', default=1.0,
+                      help='Seconds until a submitted issue import is imported (default: 1.0)')
+    parser.add_option('--fail-every', type='int', default=0,
+                      help='Answer every Nth request with 502 Bad Gateway (default: 0, never)')
+    parser.add_option('--fail-after', action='store_true', default=False,
+                      help='Carry out the failing requests before answering 502, like a gateway timing out (default: false)')
+    parser.add_option('--rate-limit-every', type='int', default=0,
+                      help='Answer every Nth request with a secondary rate limit (default: 0, never)')
+    parser.add_option('--retry-after', type='int', default=1,
+                      help='Seconds the rate limit answers ask to wait (default: 1)')
+    parser.add_option('--dump', default=None,
+                      help='Write labels, milestones, issues, comments and imports to this JSON file on exit (default: none)')
+    (options, args) = parser.parse_args()
+    try:
+        port, = args
+        port = int(port)
+    except ValueError:
+        parser.error('Wrong number of arguments')
+    logging.basicConfig(level=logging.INFO, format='%(levelname)9s: %(message)s')
+
+    server = Server(('localhost', port), Handler)
+    server.repository = Repository(options.import_delay, options.fail_every, options.fail_after,
+                                   options.rate_limit_every, options.retry_after)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info('Serving the GitHub API at http://localhost:{0}'.format(port))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    if options.dump:
+        with server.repository.lock:
+            with open(options.dump, 'w') as out:
+                json.dump(server.repository.dump(), out, indent=1)
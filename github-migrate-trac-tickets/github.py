@@ -1,10 +1,433 @@
-from github import Github
+# -*- coding: utf-8 -*-
+# Minimal client for the GitHub v3 API, see http://developer.github.com/v3/
+#
+# Requests go over a small pool of keep-alive connections and can be run
+# concurrently by a bounded set of worker threads (see GitHub.submit).
+# All threads share one view of the rate limits announced by GitHub, and
+# wait when the primary limit is used up or a secondary limit was hit.
 
-github = GitHub("git@github.com:casadi/casadi.git")
+import base64
+import errno
+import httplib
+import logging
+import Queue
+import socket
+import sys
+import threading
+import time
+import urllib
+import urlparse
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
-import requests
-import json
-r = requests.get('/user/emails')
-        if(r.ok):
-            repoItem = json.loads(r.text or r.content)
-            print "Django repository created: " + repoItem['created_at']
+from instrument import stats
+
+API_URL = 'https://api.github.com'
+USER_AGENT = 'github-migrate-trac-tickets'
+MEDIA_TYPE = 'application/vnd.github.v3+json'
+# The issue import API is a preview that must be asked for explicitly
+IMPORT_MEDIA_TYPE = 'application/vnd.github.golden-comet-preview+json'
+# Requests that can be sent again when it is unknown whether they were carried out
+IDEMPOTENT_METHODS = ('GET', 'PATCH')
+
+
+class GitHubError(Exception):
+    """GitHub answered with an error status."""
+
+    def __init__(self, status, message, body=None):
+        Exception.__init__(self, '{0}: {1}'.format(status, message))
+        self.status = status
+        self.body = body
+
+
+class AlreadyExists(GitHubError):
+    """The object to create exists already."""
+
+
+class DoesNotExist(GitHubError):
+    """The requested object does not exist."""
+
+
+class Future(object):
+    """Result of a call run by GitHub.submit."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    @classmethod
+    def call(cls, fn, *args, **kwargs):
+        """Run fn right away and return its (finished) future."""
+        future = cls()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception:
+            future.set_exc_info(sys.exc_info())
+        return future
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self):
+        """Wait for the call to finish; return its result or raise its exception."""
+        while not self._event.wait(1.0):
+            pass
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP(S) connections to one API host."""
+
+    def __init__(self, api_url, size, timeout=60):
+        url = urlparse.urlsplit(api_url)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.idle = Queue.LifoQueue(size)
+
+    def _connect(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers={}):
+        """Send a request; return (status, headers, body) with lower case header names."""
+        try:
+            conn = self.idle.get_nowait()
+            reused = True
+        except Queue.Empty:
+            conn = self._connect()
+            reused = False
+        try:
+            sent = False
+            try:
+                conn.request(method, self.prefix + path, body, headers)
+                sent = True
+                response = conn.getresponse()
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error) as e:
+                # The server dropped an idle connection; retry once on a fresh
+                # one.  A request that was sent and then not answered may have
+                # been carried out (e.g. on a timeout), so only idempotent
+                # ones are sent again then.
+                dropped = reused and (isinstance(e, httplib.BadStatusLine) and e.line in ("''", '') or
+                                      getattr(e, 'errno', None) in (errno.ECONNRESET, errno.EPIPE))
+                if sent and not dropped and method not in IDEMPOTENT_METHODS:
+                    raise
+                conn.close()
+                conn = self._connect()
+                conn.request(method, self.prefix + path, body, headers)
+                response = conn.getresponse()
+            data = response.read()
+        except:
+            conn.close()
+            raise
+        if response.getheader('connection', '').lower() == 'close':
+            conn.close()
+        else:
+            try:
+                self.idle.put_nowait(conn)
+            except Queue.Full:
+                conn.close()
+        return response.status, dict(response.getheaders()), data
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                return
+
+
+class RateLimit(object):
+    """Track GitHub's rate limit headers and delay requests accordingly.
+
+    Requests wait while the primary limit (X-RateLimit-Remaining) is used
+    up, until X-RateLimit-Reset.  A secondary limit answer (403 or 429 with
+    Retry-After, or without it) blocks all requests for the announced time,
+    or for an exponentially growing backoff.  Writes can additionally be
+    spaced by write_interval seconds, as GitHub asks integrators to do.
+    """
+    backoff_start = 60
+
+    def __init__(self, write_interval=0.0):
+        self.write_interval = write_interval
+        self.lock = threading.Lock()
+        self.resume_at = 0
+        self.next_write = 0
+        self.backoff = self.backoff_start
+        self.remaining = None
+
+    def wait(self, method):
+        with self.lock:
+            now = time.time()
+            at = self.resume_at
+            if method != 'GET' and self.write_interval:
+                at = max(at, self.next_write)
+                self.next_write = max(now, at) + self.write_interval
+        delay = at - now
+        if delay > 0:
+            if delay > 5:
+                logging.info('Waiting {0:.0f}s for the GitHub rate limit'.format(delay))
+            time.sleep(delay)
+
+    def update(self, status, headers, body):
+        """Record a response; return True if the request must be retried."""
+        now = time.time()
+        with self.lock:
+            remaining = headers.get('x-ratelimit-remaining')
+            reset = headers.get('x-ratelimit-reset')
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if status not in (403, 429):
+                if remaining == '0' and reset:
+                    self.resume_at = max(self.resume_at, int(reset) + 1)
+                self.backoff = self.backoff_start
+                return False
+            retry_after = headers.get('retry-after')
+            if retry_after:
+                delay = int(retry_after)
+            elif remaining == '0' and reset:
+                delay = int(reset) + 1 - now
+            elif 'rate limit' in body.lower() or 'abuse' in body.lower():
+                delay = self.backoff
+                self.backoff *= 2
+            else:
+                return False
+            logging.warn('GitHub rate limit hit; pausing requests for {0:.0f}s'.format(delay))
+            self.resume_at = max(self.resume_at, now + delay)
+            return True
+
+
+class GitHub(object):
+    """Access issues, comments, labels and milestones of one repository.
+
+    Calls block and return the decoded JSON answer.  submit() runs a call
+    in one of `concurrency` worker threads and returns a Future.
+    """
+    max_retries = 5
+
+    def __init__(self, username, password, repo, dry_run=False,
+                 api_url=API_URL, concurrency=4, write_interval=0.0):
+        """Username and password (or token) for auth; repo is like 'myorg/myapp'.
+        """
+        self.repo = repo
+        self.dry_run = dry_run
+        self.auth = 'Basic ' + base64.b64encode('{0}:{1}'.format(username, password))
+        self.pool = ConnectionPool(api_url, concurrency)
+        self.rate_limit = RateLimit(write_interval)
+        self.concurrency = concurrency
+        self.tasks = Queue.Queue(4 * concurrency)
+        self.workers = []
+        self.dry_run_count = 0
+
+    # == Plumbing ==
+
+    def _path(self, path, query=None):
+        path = '/repos/{0}{1}'.format(self.repo, path)
+        if query:
+            path += '?' + (query if isinstance(query, basestring) else urllib.urlencode(query))
+        return path
+
+    def request(self, method, path, data=None, accept=MEDIA_TYPE):
+        """Send a request to the API and return the decoded answer.
+
+        Rate limited requests are retried, and failed (5xx) ones if
+        idempotent: GitHub may have carried out a POST before failing.
+        Raises DoesNotExist (404), AlreadyExists (422 already_exists) or
+        GitHubError for other errors.
+        """
+        return self._request(method, path, data, accept)[0]
+
+    def _request(self, method, path, data=None, accept=MEDIA_TYPE):
+        headers = {
+            'Authorization': self.auth,
+            'Accept': accept,
+            'User-Agent': USER_AGENT,
+        }
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        if self.dry_run and method != 'GET':
+            logging.debug('dry run: {0} {1} {2}'.format(method, path, body))
+            self.dry_run_count += 1
+            return dict(data or {}, number=self.dry_run_count), {}
+        attempt = 0
+        while True:
+            self.rate_limit.wait(method)
+            with stats.timer('http') as measurement:
+                status, response_headers, response = self.pool.request(method, path, body, headers)
+                measurement.bytes = len(body or '') + len(response)
+            attempt += 1
+            if attempt <= self.max_retries:
+                if self.rate_limit.update(status, response_headers, response):
+                    continue
+                if status >= 500 and method in IDEMPOTENT_METHODS:
+                    time.sleep(2 ** attempt)
+                    continue
+            if status >= 400:
+                self._raise(status, response)
+            return (json.loads(response) if response else None), response_headers
+
+    def _raise(self, status, response):
+        try:
+            error = json.loads(response)
+        except ValueError:
+            error = {'message': response}
+        message = error.get('message', '')
+        if status == 404:
+            raise DoesNotExist(status, message, error)
+        if status == 422 and any(e.get('code') == 'already_exists' for e in error.get('errors', [])):
+            raise AlreadyExists(status, message, error)
+        raise GitHubError(status, '{0} {1}'.format(message, error.get('errors', '')), error)
+
+    def _create(self, path, data, created):
+        """POST data to path to create something.
+
+        When the request failed in a way that leaves open whether GitHub
+        carried it out (a 5xx answer, or none), created() returns what GitHub
+        has if it did, or None, before the request is sent again.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self.request('POST', self._path(path), data)
+            except (GitHubError, httplib.HTTPException, socket.error) as e:
+                attempt += 1
+                if isinstance(e, GitHubError) and e.status < 500 or attempt > self.max_retries:
+                    raise
+                logging.warn('POST {0} failed ({1}); checking whether it was carried out'.format(path, e))
+                time.sleep(2 ** attempt)
+                result = created()
+                if result is not None:
+                    return result
+
+    def _get_all(self, path, query=None):
+        """GET a list, following the pagination links."""
+        query = query + '&per_page=100' if query else 'per_page=100'
+        path = self._path(path, query)
+        items = []
+        while path:
+            page, headers = self._request('GET', path)
+            items.extend(page)
+            path = None
+            for link in headers.get('link', '').split(','):
+                if link.strip().endswith('rel="next"'):
+                    url = urlparse.urlsplit(link.strip().split(';')[0].strip('<> '))
+                    path = url.path[len(self.pool.prefix):] + '?' + url.query
+        return items
+
+    def _worker(self):
+        while True:
+            future, fn, args, kwargs = self.tasks.get()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception:
+                future.set_exc_info(sys.exc_info())
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in a worker thread; return a Future.
+
+        Blocks while too many calls are queued.
+        """
+        if len(self.workers) < self.concurrency:
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        future = Future()
+        self.tasks.put((future, fn, args, kwargs))
+        return future
+
+    def close(self):
+        self.pool.close()
+
+    # == API ==
+
+    def issues(self, id_=None, data=None, query=None):
+        """Get issues or POST and issue with data.
+        Create a new one like:    issues(data={'title': 'Plough', 'body': 'Plover'})
+        Update one like:          issues(5, data={'state': 'closed'})
+        """
+        if data is None:
+            if id_ is None:
+                return self._get_all('/issues', query)
+            return self.request('GET', self._path('/issues/{0}'.format(id_)))
+        if id_ is None:
+            # A duplicate would shift the numbers of all later issues
+            def created():
+                latest = self._latest_issue()
+                if latest and latest['title'] == data['title'] and latest.get('body') == data.get('body'):
+                    return latest
+            return self._create('/issues', data, created)
+        return self.request('PATCH', self._path('/issues/{0}'.format(id_)), data)
+
+    def _latest_issue(self):
+        latest = self.request('GET', self._path('/issues', 'state=all&sort=created&direction=desc&per_page=1'))
+        return latest[0] if latest else None
+
+    def next_issue_number(self):
+        """Number the next created issue will get (pull requests share the numbering)."""
+        latest = self._latest_issue()
+        return latest['number'] + 1 if latest else 1
+
+    def issue_comments(self, id_, data=None):
+        """Get comments for a ticket by its number or POST a comment with data.
+        Example: issue_comments(5, data={'body': 'Is decapitated'})
+        """
+        if data is None:
+            return self._get_all('/issues/{0}/comments'.format(id_))
+        def created():
+            comments = self.issue_comments(id_)
+            if comments and comments[-1]['body'] == data['body']:
+                return comments[-1]
+        return self._create('/issues/{0}/comments'.format(id_), data, created)
+
+    def import_issue(self, data):
+        """Import an issue with its comments in one request, see
+        https://gist.github.com/jonmagic/5282384165e0f86ef105
+        Example: import_issue({'issue': {'title': 'Plough', 'body': 'Plover', 'closed': True},
+                               'comments': [{'body': 'Is decapitated'}]})
+        GitHub answers with the 'id' and 'status' of the import, which runs in the background.
+        """
+        return self.request('POST', self._path('/import/issues'), data, accept=IMPORT_MEDIA_TYPE)
+
+    def import_status(self, id_):
+        """Get an import by its id; its 'status' is pending, imported (with the 'issue_url') or failed."""
+        return self.request('GET', self._path('/import/issues/{0}'.format(id_)), accept=IMPORT_MEDIA_TYPE)
+
+    def labels(self, data=None):
+        """Get labels or POST a new one like labels(data={'name': 'bug', 'color': 'ff0000'})
+        """
+        if data is None:
+            return self._get_all('/labels')
+        return self._create('/labels', data,
+                            lambda: next((l for l in self.labels() if l['name'] == data['name']), None))
+
+    def milestones(self, id_=None, data=None, query=None):
+        """Get milestones (query='state=closed' for closed ones) or POST/PATCH one with data.
+        """
+        if data is None:
+            if id_ is None:
+                return self._get_all('/milestones', query)
+            return self.request('GET', self._path('/milestones/{0}'.format(id_)))
+        if id_ is None:
+            return self._create('/milestones', data,
+                                lambda: next((m for m in self.milestones(query='state=all')
+                                              if m['title'] == data['title']), None))
+        return self.request('PATCH', self._path('/milestones/{0}'.format(id_)), data)
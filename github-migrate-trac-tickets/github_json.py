@@ -1,11 +1,17 @@
 import base64
+import gzip
+import tarfile
+import time
 import urllib2
 import os
+from cStringIO import StringIO
 try:
     import json
 except ImportError:
     import simplejson as json
 
+from github import Future
+
 
 class GitHubJson():
     """Dump json format suitable for import, See
@@ -19,28 +25,205 @@ class GitHubJson():
         os.makedirs(self.repo)
         for subdir in ('issues', 'milestones'):
           os.makedirs(os.path.join(self.repo, subdir))
+        # Numbers are handed out in creation order, like GitHub does.
+        self.issue_count = 0
+        self.milestone_count = 0
+        # (number, comments) of the issue comments are being added to
+        self.pending_comments = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Files are written right away; return the finished Future.
+        """
+        return Future.call(fn, *args, **kwargs)
+
+    def close(self):
+        self._flush_comments()
 
-    def issues(self, id_, data=None):
-        """Get issues or POST and issue with data.
+    def _flush_comments(self):
+        if self.pending_comments is None:
+            return
+        id_, comments = self.pending_comments
+        self.pending_comments = None
+        path = os.path.join(self.repo, 'issues', '%s.comments.json' % id_)
+        if os.path.exists(path):
+            with open(path, 'r') as infile:
+                comments = json.load(infile) + comments
+        with open(path, 'w') as outfile:
+          json.dump(comments, outfile)
+
+    def issues(self, id_=None, data=None):
+        """Write a new issue, or update an already written one.
         Create a new one like:    issues(data={'title': 'Plough', 'body': 'Plover'})
+        Close it like:            issues(1, data={'state': 'closed'})
         """
-        with open(os.path.join(self.repo, 'issues', '%s.json' % id_), 'w') as outfile:
+        path = os.path.join(self.repo, 'issues', '%s.json' % id_)
+        if id_ is None:
+            self.issue_count += 1
+            id_ = self.issue_count
+            path = os.path.join(self.repo, 'issues', '%s.json' % id_)
+        else:
+            # The import format has no state, only a closed flag
+            data = dict(data)
+            if data.pop('state', None) == 'closed':
+                data['closed'] = True
+            with open(path, 'r') as infile:
+                issue = json.load(infile)
+            issue.update(data)
+            data = issue
+        with open(path, 'w') as outfile:
           json.dump(data, outfile)
-        return data
+        return dict(data, number=id_)
+
+    def next_issue_number(self):
+        return self.issue_count + 1
+
+    def start_issues_at(self, number):
+        """Number the next issue number, e.g. when exporting one shard of a migration."""
+        self.issue_count = number - 1
 
     def issue_comments(self, id_, data=None):
-        """Get comments for a ticket by its number or POST a comment with data.
+        """Add a comment, or a list of them, to an issue.
         Example: issue_comments(5, data={'body': 'Is decapitated'})
+
+        The comments of an issue are collected and written to its
+        comments file once comments for another issue come, or on close().
         """
-        with open(os.path.join(self.repo, 'issues', '%s.comments.json' % id_), 'w') as outfile:
-          json.dump(data, outfile)
+        if self.pending_comments is None or self.pending_comments[0] != id_:
+            self._flush_comments()
+            self.pending_comments = (id_, [])
+        if isinstance(data, list):
+            self.pending_comments[1].extend(data)
+        else:
+            self.pending_comments[1].append(data)
+        return data
+
+    def labels(self, data=None):
+        """Labels are created by the import itself; there are no existing ones.
+        """
+        if data is None:
+            return []
         return data
 
-    def milestones(self, id_, data=None):
-        """Set milestones
+    def milestones(self, id_=None, data=None, query=None):
+        """Set milestones; a new one is numbered if id_ is not given.
         """
+        if data is None:
+            return []
+        if id_ is None:
+            self.milestone_count += 1
+            id_ = self.milestone_count
         data['number'] = id_
         with open(os.path.join(self.repo, 'milestones', "%s.json" % id_), 'w') as outfile:
             json.dump(data, outfile)
         return data
 
+
+class GitHubJsonStream(GitHubJson):
+    """Stream the import data into a single file instead of one file per object.
+
+    format is 'ndjson', one JSON record per line:
+        {"type": "milestone", "number": 1, "milestone": {...}}
+        {"type": "issue", "number": 1, "issue": {...}, "comments": [...]}
+        {"type": "issue_update", "number": 1, "issue": {...}}
+    or 'tar', an archive with the same issues/ and milestones/ layout as the
+    GitHubJson directory.  Either is gzip compressed if compress is set.
+
+    The last created issue is kept in memory, so closing it and adding its
+    comments go into its record instead of separate updates.
+    """
+    def __init__(self, repo, format='ndjson', compress=False, dry_run=False):
+        self.repo = repo
+        self.format = format
+        self.path = '%s.%s%s' % (repo, 'tar' if format == 'tar' else 'ndjson', '.gz' if compress else '')
+        if os.path.exists(self.path):
+            raise OSError('%s exists already' % self.path)
+        if os.path.dirname(self.path) and not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        self.file = open(self.path, 'wb', 1 << 20)
+        if format == 'tar':
+            self.archive = tarfile.open(fileobj=self.file, mode='w|gz' if compress else 'w|')
+        elif compress:
+            self.stream = gzip.GzipFile(fileobj=self.file, mode='wb')
+        else:
+            self.stream = self.file
+        self.issue_count = 0
+        self.milestone_count = 0
+        # [number, issue, comments] of the last created issue
+        self.pending = None
+
+    def _add_member(self, name, data):
+        payload = json.dumps(data)
+        info = tarfile.TarInfo(os.path.join(os.path.basename(self.repo), name))
+        info.size = len(payload)
+        info.mtime = time.time()
+        self.archive.addfile(info, StringIO(payload))
+
+    def _write(self, record):
+        self.stream.write(json.dumps(record))
+        self.stream.write('\n')
+
+    def _flush_pending(self):
+        if self.pending is None:
+            return
+        number, issue, comments = self.pending
+        self.pending = None
+        if self.format == 'tar':
+            self._add_member('issues/%s.json' % number, issue)
+            if comments:
+                self._add_member('issues/%s.comments.json' % number, comments)
+        else:
+            self._write({'type': 'issue', 'number': number, 'issue': issue, 'comments': comments})
+
+    def issues(self, id_=None, data=None):
+        """Stream a new issue, or update an already streamed one.
+        """
+        if id_ is None:
+            self._flush_pending()
+            self.issue_count += 1
+            self.pending = [self.issue_count, data, []]
+            return dict(data, number=self.issue_count)
+        # The import format has no state, only a closed flag
+        data = dict(data)
+        if data.pop('state', None) == 'closed':
+            data['closed'] = True
+        if self.pending is not None and self.pending[0] == id_:
+            self.pending[1].update(data)
+            return dict(self.pending[1], number=id_)
+        if self.format == 'tar':
+            raise ValueError('Issue %s was already written to %s' % (id_, self.path))
+        self._write({'type': 'issue_update', 'number': id_, 'issue': data})
+        return dict(data, number=id_)
+
+    def issue_comments(self, id_, data=None):
+        """Add a comment, or a list of them, to the last created issue.
+        """
+        if self.pending is None or self.pending[0] != id_:
+            raise ValueError('Comments must directly follow their issue %s' % id_)
+        if isinstance(data, list):
+            self.pending[2].extend(data)
+        else:
+            self.pending[2].append(data)
+        return data
+
+    def milestones(self, id_=None, data=None, query=None):
+        """Stream a milestone; a new one is numbered if id_ is not given.
+        """
+        if data is None:
+            return []
+        if id_ is None:
+            self.milestone_count += 1
+            id_ = self.milestone_count
+        data['number'] = id_
+        if self.format == 'tar':
+            self._add_member('milestones/%s.json' % id_, data)
+        else:
+            self._write({'type': 'milestone', 'number': id_, 'milestone': data})
+        return data
+
+    def close(self):
+        self._flush_pending()
+        if self.format == 'tar':
+            self.archive.close()
+        elif self.stream is not self.file:
+            self.stream.close()
+        self.file.close()
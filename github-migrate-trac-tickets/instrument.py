@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Timers and counters for the phases of a migration (reading Trac,
+# converting, writing to GitHub or git), to find out where the time goes.
+#
+# Code measures a phase with stats.timer('name') or stats.iterate('name', it);
+# the scripts log stats.report() at the end of a run and, with --profile,
+# also write stats.summary() as json.
+
+import json
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Phase(object):
+    """Number of items, bytes and the duration of every measurement of a phase."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.latencies = array('d')
+
+    def add(self, seconds, items=1, nbytes=0):
+        self.items += items
+        self.bytes += nbytes
+        self.seconds += seconds
+        self.latencies.append(seconds)
+
+    def merge(self, other):
+        self.items += other.items
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+        self.latencies.extend(other.latencies)
+
+    def summary(self):
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            # Nearest rank
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))] if ordered else 0.0
+        return OrderedDict([
+            ('items', self.items),
+            ('bytes', self.bytes),
+            ('seconds', self.seconds),
+            ('items_per_second', self.items / self.seconds if self.seconds else 0.0),
+            ('bytes_per_second', self.bytes / self.seconds if self.seconds else 0.0),
+            ('calls', len(ordered)),
+            ('p50', percentile(50)),
+            ('p90', percentile(90)),
+            ('p99', percentile(99)),
+            ('max', ordered[-1] if ordered else 0.0),
+        ])
+
+
+class Measurement(object):
+    """Yielded by Stats.timer; set items and bytes once they are known."""
+
+    def __init__(self, items, nbytes):
+        self.items = items
+        self.bytes = nbytes
+
+
+class Stats(object):
+    """The phases of one process, in the order they were first measured.
+
+    Measurements may come from several threads.  Worker processes hand
+    theirs to the parent with take() and merge() (see parallel.py).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = OrderedDict()
+        self.start = time.time()
+
+    def add(self, name, seconds, items=1, nbytes=0):
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = Phase(name)
+            phase.add(seconds, items, nbytes)
+
+    @contextmanager
+    def timer(self, name, items=1, nbytes=0):
+        """Time the with block as one measurement of phase name."""
+        measurement = Measurement(items, nbytes)
+        start = time.time()
+        try:
+            yield measurement
+        finally:
+            self.add(name, time.time() - start, measurement.items, measurement.bytes)
+
+    def iterate(self, name, iterable, size=None):
+        """Yield the items of iterable, timing each step as one measurement.
+
+        size(item) gives the number of bytes an item counts for.
+        """
+        items = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.add(name, time.time() - start, 1, size(item) if size else 0)
+            yield item
+
+    def take(self):
+        """Return the phases measured so far and start afresh."""
+        with self.lock:
+            phases, self.phases = self.phases, OrderedDict()
+            self.start = time.time()
+        return phases
+
+    def merge(self, phases):
+        with self.lock:
+            for name, other in phases.items():
+                phase = self.phases.get(name)
+                if phase is None:
+                    phase = self.phases[name] = Phase(name)
+                phase.merge(other)
+
+    def summary(self):
+        with self.lock:
+            return OrderedDict([
+                ('wall_seconds', time.time() - self.start),
+                ('phases', OrderedDict((name, phase.summary()) for name, phase in self.phases.items())),
+            ])
+
+    def report(self):
+        """Log a line per phase."""
+        summary = self.summary()
+        logging.info('Finished in {0:.1f}s'.format(summary['wall_seconds']))
+        for name, phase in summary['phases'].items():
+            logging.info('{0:>10}: {1[items]:8d} items {1[seconds]:8.2f}s {1[items_per_second]:9.1f}/s '
+                         '{2:9.2f} MB/s  p50 {1[p50]:.4f}s p90 {1[p90]:.4f}s p99 {1[p99]:.4f}s'.format(
+                             name, phase, phase['bytes_per_second'] / 1e6))
+
+    def dump(self, path):
+        with open(path, 'w') as out:
+            json.dump(self.summary(), out, indent=2)
+
+
+def utf8_size(text):
+    """Size of a (unicode) text in bytes, 0 for None."""
+    if not text:
+        return 0
+    if isinstance(text, unicode):
+        return len(text.encode('utf-8'))
+    return len(text)
+
+
+# The statistics of this process
+stats = Stats()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Create issues with GitHub's issue import API: one request carries an issue,
+# its comments, its creation time and whether it is closed, where the issues
+# API needs a request for the issue, one per comment and one to close it, and
+# sets the creation time to now.  GitHub imports in the background, so the
+# status of every import is polled until it is done.
+
+import logging
+import time
+
+from github import DoesNotExist, GitHubError
+
+
+def import_request(issue, comments, closed):
+    """Return the import request for an issue made by TicketConverter.
+
+    comments are {'body': ..., 'created_at': ...} dicts.  A closed issue
+    is closed at its last update.
+    """
+    data = dict((key, issue[key]) for key in ('title', 'body', 'created_at', 'updated_at', 'assignee', 'milestone')
+                if key in issue)
+    # Labels are given by name, and created by the import if needed
+    data['labels'] = [label['name'] for label in issue.get('labels', [])]
+    data['closed'] = closed
+    if closed:
+        data['closed_at'] = issue['updated_at']
+    return {'issue': data, 'comments': comments}
+
+
+class IssueImporter(object):
+    """Submit issue imports and poll them until GitHub is done with them.
+
+    Imports are submitted one at a time and in order, as GitHub numbers the
+    issues in the order they were submitted, while up to window of them
+    are still pending.  Pending imports are polled concurrently through
+    github.submit, each after poll_interval seconds and then at doubling
+    intervals of at most max_poll_interval.
+    """
+
+    def __init__(self, github, window=50, poll_interval=1.0, max_poll_interval=30.0):
+        self.github = github
+        self.window = window
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        # import id: [key, time of the next poll, polling interval]
+        self.pending = {}
+        # (key, issue number, errors) of the imports done since finished() was called
+        self.done = []
+
+    def submit(self, key, data):
+        """Submit the import request data for key, e.g. a ticket id; return the import id.
+
+        Waits while window imports are pending.  In a dry run nothing is
+        imported, None is returned and finished() does not report it, as
+        there is no issue to record.
+        """
+        while len(self.pending) >= self.window:
+            self._poll(wait=True)
+        result = self.github.import_issue(data)
+        if self.github.dry_run:
+            return None
+        self.resume(key, result['id'])
+        return result['id']
+
+    def resume(self, key, id_):
+        """Poll an import that was submitted before, e.g. by an interrupted run."""
+        self.pending[id_] = [key, time.time() + self.poll_interval, self.poll_interval]
+
+    def finished(self, wait=False):
+        """Poll the imports that are due; return the (key, issue number, errors) of those done.
+
+        The number of a failed import is None and errors are what GitHub
+        reported; otherwise errors is None.  With wait, polls until no
+        import is pending.
+        """
+        self._poll()
+        while wait and self.pending:
+            self._poll(wait=True)
+        done, self.done = self.done, []
+        return done
+
+    def _poll(self, wait=False):
+        """Poll the pending imports that are due; with wait, wait for the next one to be due first."""
+        now = time.time()
+        if wait and self.pending:
+            delay = min(next_poll for _, next_poll, _ in self.pending.itervalues()) - now
+            if delay > 0:
+                time.sleep(delay)
+                now = time.time()
+        polls = [(id_, self.github.submit(self.github.import_status, id_))
+                 for id_, (_, next_poll, _) in self.pending.items() if next_poll <= now]
+        for id_, future in polls:
+            key, _, interval = self.pending[id_]
+            try:
+                status = future.result()
+            except DoesNotExist:
+                # Right after the submission an import may not be visible yet
+                status = {'status': 'pending'}
+            except GitHubError as e:
+                logging.warn(u'Could not get the status of import {0}: {1}'.format(id_, e))
+                status = {'status': 'pending'}
+            if status['status'] == 'imported':
+                del self.pending[id_]
+                self.done.append((key, int(status['issue_url'].rsplit('/', 1)[1]), None))
+            elif status['status'] == 'failed':
+                del self.pending[id_]
+                self.done.append((key, None, status.get('errors', [])))
+            else:
+                interval = min(2 * interval, self.max_poll_interval)
+                self.pending[id_][1:] = [time.time() + interval, interval]
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Durable record of the migration steps that already happened, so an
+# interrupted migration can be restarted without duplicating issues.
+
+import os
+import sqlite3
+
+
+class Journal(object):
+    """Migration journal in an SQLite file (or ':memory:' for none).
+
+    Every step is committed as soon as GitHub confirmed it.  The number an
+    issue is about to be created as is recorded before, so that a rerun can
+    tell whether GitHub created it after all.  Issues are recorded as soon
+    as they are created, as unfinished until their
+    comments are posted and, for closed tickets, they are closed too; the
+    number of comments posted is recorded after each one.
+    Issue imports are recorded when submitted, and their issues once
+    GitHub imported them.
+    A journal belongs to one target repository.
+
+    In a dry run nothing is written: an existing journal is only read, as
+    the numbers of a dry run are made up.
+    """
+
+    def __init__(self, path, repo, dry_run=False):
+        self.path = path
+        self.dry_run = dry_run
+        if dry_run and not os.path.exists(path):
+            path = ':memory:'
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS milestone (name TEXT PRIMARY KEY, number INTEGER);
+            CREATE TABLE IF NOT EXISTS issue (ticket INTEGER PRIMARY KEY, number INTEGER, finished INTEGER);
+            CREATE TABLE IF NOT EXISTS issue_creating (ticket INTEGER PRIMARY KEY, number INTEGER);
+            CREATE TABLE IF NOT EXISTS issue_comment (ticket INTEGER PRIMARY KEY, posted INTEGER);
+            CREATE TABLE IF NOT EXISTS issue_import (ticket INTEGER PRIMARY KEY, id INTEGER);
+        ''')
+        row = self.conn.execute('SELECT value FROM meta WHERE key="repo"').fetchone()
+        if row is None:
+            self._write(('INSERT INTO meta (key, value) VALUES ("repo", ?)', (repo,)))
+        elif row[0] != repo:
+            raise ValueError('Journal {0} belongs to repository {1}, not {2}'.format(self.path, row[0], repo))
+
+    def _write(self, *statements):
+        """Run (sql, params) statements in one transaction, unless in a dry run."""
+        if self.dry_run:
+            return
+        with self.conn:
+            for sql, params in statements:
+                self.conn.execute(sql, params)
+
+    def milestone_numbers(self):
+        """Return {name: number} of the milestones created so far."""
+        return dict(self.conn.execute('SELECT name, number FROM milestone'))
+
+    def milestone_created(self, name, number):
+        self._write(('INSERT OR REPLACE INTO milestone (name, number) VALUES (?, ?)', (name, number)))
+
+    def issue_numbers(self):
+        """Return {ticket id: issue number} of the issues created so far."""
+        return dict(self.conn.execute('SELECT ticket, number FROM issue'))
+
+    def unfinished_issues(self):
+        """Return [(ticket id, issue number)] of created issues still missing comments or closing."""
+        return self.conn.execute('SELECT ticket, number FROM issue WHERE NOT finished ORDER BY ticket').fetchall()
+
+    def creating_issues(self):
+        """Return {ticket id: issue number} of the issues that may or may not have been created."""
+        return dict(self.conn.execute('SELECT ticket, number FROM issue_creating'))
+
+    def issue_creating(self, tid, number):
+        self._write(('INSERT OR REPLACE INTO issue_creating (ticket, number) VALUES (?, ?)', (tid, number)))
+
+    def issue_created(self, tid, number, finished=True):
+        statements = [('DELETE FROM issue_creating WHERE ticket=?', (tid,)),
+                      ('INSERT OR REPLACE INTO issue (ticket, number, finished) VALUES (?, ?, ?)',
+                       (tid, number, finished))]
+        if not finished:
+            statements.append(('INSERT OR REPLACE INTO issue_comment (ticket, posted) VALUES (?, 0)', (tid,)))
+        self._write(*statements)
+
+    def comments_posted(self, tid):
+        """Return how many comments of an unfinished issue are posted, or None if all of them are."""
+        row = self.conn.execute('SELECT posted FROM issue_comment WHERE ticket=?', (tid,)).fetchone()
+        return row and row[0]
+
+    def comment_posted(self, tid, count):
+        """Record that the first count comments of an unfinished issue are posted."""
+        self._write(('UPDATE issue_comment SET posted=? WHERE ticket=?', (count, tid)))
+
+    def issue_finished(self, tid):
+        self._write(('DELETE FROM issue_comment WHERE ticket=?', (tid,)),
+                    ('UPDATE issue SET finished=1 WHERE ticket=?', (tid,)))
+
+    def pending_imports(self):
+        """Return [(ticket id, import id)] of the submitted issue imports not known to be done."""
+        return self.conn.execute('SELECT ticket, id FROM issue_import ORDER BY ticket').fetchall()
+
+    def import_submitted(self, tid, id_):
+        self._write(('INSERT OR REPLACE INTO issue_import (ticket, id) VALUES (?, ?)', (tid, id_)))
+
+    def import_done(self, tid, number=None):
+        """Record that the import of a ticket is done; number is None if it failed."""
+        statements = [('DELETE FROM issue_import WHERE ticket=?', (tid,))]
+        if number is not None:
+            statements.append(('INSERT OR REPLACE INTO issue (ticket, number, finished) VALUES (?, ?, 1)',
+                               (tid, number)))
+        self._write(*statements)
+
+    def close(self):
+        self.conn.close()
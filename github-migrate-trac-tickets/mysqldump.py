@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Read the tables of a plain MySQL dump, like the trac.sql backup SourceForge
+# hands out, without importing it into a database first.
+#
+# Rows are parsed from the INSERT statements as the file is read, so memory
+# only depends on the longest statement.  A first pass notes where the
+# statements of each table are, so later scans of a table seek to them.
+#
+# Strings may span lines, as some dump tools write their newlines as is, and
+# may be binary: mysqldump writes BLOB columns as _binary '...', or as 0x...
+# with --hex-blob.  Values the parser does not know are rejected, not guessed.
+
+import binascii
+import gzip
+import re
+
+
+def _unescape(match):
+    char = match.group(1)
+    if char is None:
+        return "'"
+    return MysqlDump.escapes.get(char, char)
+
+
+def _unhex(digits):
+    # MySQL pads hex literals with an odd number of digits on the left
+    if len(digits) % 2:
+        digits = '0' + digits
+    return binascii.unhexlify(digits)
+
+
+class MysqlDump(object):
+    """The tables of a mysqldump (or phpMyAdmin) dump file, optionally gzip compressed.
+
+    Tables are read with rows(table), which yields one tuple per row in
+    the order of columns[table].  Strings are unicode, numbers int or
+    float and NULL None.  Binary strings and hex literals are decoded as
+    UTF-8 like the other strings, as Trac only stores text in them.
+    """
+    rx_create = re.compile(r'^CREATE TABLE (?:IF NOT EXISTS )?`([^`]+)`')
+    rx_column = re.compile(r'^\s+`([^`]+)`')
+    rx_insert = re.compile(r'^INSERT (?:IGNORE )?INTO `([^`]+)`\s*(?:\(([^)]*)\))?\s*VALUES\s*')
+    rx_value = re.compile(r"\s*(?:(?:_(\w+)\s*)?'([^'\\]*(?:(?:\\.|'')[^'\\]*)*)'|[xX]'([0-9a-fA-F]*)'|0x([0-9a-fA-F]+)"
+                          r"|(NULL)|([-+0-9.eE]+))\s*([,)])", re.S)
+    # The start of a value that goes on in the next line; group 1 is '' inside a string
+    rx_partial = re.compile(r"\s*(?:(?:_\w+\s*|[xX])?'(?:[^'\\]|\\.|'')*\\?('?)|0x[0-9a-fA-F]*|NULL|[-+0-9.eE]+)?\s*\Z", re.S)
+    rx_escape = re.compile(r"\\(.)|''", re.S)
+    rx_escaped = re.compile(r"\\.", re.S)
+    # Introducers of strings that are UTF-8 or binary
+    charsets = ('binary', 'utf8', 'utf8mb3', 'utf8mb4')
+    escapes = {'0': '\0', 'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'Z': '\x1a'}
+
+    def __init__(self, path):
+        self.path = path
+        # table: [column]
+        self.columns = {}
+        # table: [start, end] offsets of the INSERT statements
+        self.extents = {}
+        self._index()
+
+    def _open(self):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'rb')
+        return open(self.path, 'rb')
+
+    def _index(self):
+        dump = self._open()
+        try:
+            offset = 0
+            create = None
+            # The extent of the table whose INSERT statements are being read
+            extent = None
+            # Inside an INSERT statement, and inside one of its strings
+            statement = string = False
+            for line in dump:
+                if statement:
+                    pass
+                elif line.startswith('INSERT'):
+                    insert = self.rx_insert.match(line)
+                    if insert:
+                        table = insert.group(1)
+                        if insert.group(2):
+                            self.columns[table] = [c.strip().strip('`') for c in insert.group(2).split(',')]
+                        if extent is not None and extent is not self.extents.get(table):
+                            extent[1] = offset
+                        extent = self.extents.setdefault(table, [offset, None])
+                        statement = True
+                else:
+                    if extent is not None:
+                        extent[1] = offset
+                        extent = None
+                    if create is not None:
+                        column = self.rx_column.match(line)
+                        if column:
+                            self.columns[create].append(column.group(1))
+                        elif not line.startswith(' '):
+                            create = None
+                    elif line.startswith('CREATE TABLE'):
+                        create = self.rx_create.match(line).group(1)
+                        self.columns[create] = []
+                if statement:
+                    if self._toggles_string(line):
+                        string = not string
+                    if not string and line.rstrip().endswith(';'):
+                        statement = False
+                offset += len(line)
+            if extent is not None:
+                extent[1] = offset
+        finally:
+            dump.close()
+
+    def _toggles_string(self, line):
+        """Return whether line opens or closes a string: its quotes that are not escaped are odd."""
+        if "'" not in line:
+            return False
+        # '' leaves a string as it is
+        return (self.rx_escaped.sub('', line) if '\\' in line else line).count("'") % 2 == 1
+
+    def has_table(self, table):
+        return table in self.extents
+
+    def _values(self, text, pos, row):
+        """Parse values of a row from text[pos:] into row.
+
+        Returns (position, row finished, inside a string): a row that is not
+        finished goes on in the next line, from position on.
+        """
+        while pos < len(text):
+            match = self.rx_value.match(text, pos)
+            if not match:
+                partial = self.rx_partial.match(text, pos)
+                if not partial:
+                    raise ValueError('Unsupported value in %s at "%s"' % (self.path, text[pos:pos + 40]))
+                return pos, False, partial.group(1) == ''
+            charset, string, hex_string, hex_number, null, number, end = match.groups()
+            if charset is not None and charset.lower() not in self.charsets:
+                raise ValueError('Unsupported character set _%s in %s at "%s"' % (charset, self.path, text[pos:pos + 40]))
+            if string is not None:
+                if '\\' in string or "''" in string:
+                    string = self.rx_escape.sub(_unescape, string)
+                row.append(string.decode('utf-8', 'replace'))
+            elif hex_string is not None or hex_number is not None:
+                row.append(_unhex(hex_string if hex_string is not None else hex_number).decode('utf-8', 'replace'))
+            elif null:
+                row.append(None)
+            elif '.' in number or 'e' in number or 'E' in number:
+                row.append(float(number))
+            else:
+                row.append(int(number))
+            pos = match.end()
+            if end == ')':
+                return pos, True, False
+        return pos, False, False
+
+    def rows(self, table):
+        """Yield the rows of table as tuples."""
+        extent = self.extents.get(table)
+        if extent is None:
+            return
+        dump = self._open()
+        try:
+            dump.seek(extent[0])
+            offset = extent[0]
+            # Inside an INSERT statement of table
+            current = False
+            row = None
+            # The lines of a row that goes on in the next line, and whether it stopped inside a string
+            pending = []
+            string = False
+            for line in dump:
+                if offset >= extent[1]:
+                    break
+                offset += len(line)
+                pos = 0
+                if row is None:
+                    insert = self.rx_insert.match(line)
+                    if insert:
+                        current = insert.group(1) == table
+                        pos = insert.end()
+                if not current:
+                    continue
+                if pending:
+                    pending.append(line)
+                    if string and not self._toggles_string(line):
+                        # The string does not end in this line
+                        continue
+                    text = ''.join(pending)
+                    pending = []
+                else:
+                    text = line
+                while pos < len(text):
+                    if row is None:
+                        # Between rows: "(" starts one, "," and ";" separate them
+                        char = text[pos]
+                        pos += 1
+                        if char == '(':
+                            row = []
+                        elif char == ';':
+                            current = False
+                            break
+                        elif char != ',' and not char.isspace():
+                            raise ValueError('Cannot parse the rows of %s at "%s"' % (self.path, text[pos - 1:pos + 40]))
+                        continue
+                    pos, finished, string = self._values(text, pos, row)
+                    if finished:
+                        yield tuple(row)
+                        row = None
+                    elif pos < len(text):
+                        pending.append(text[pos:])
+                        break
+            if pending or row is not None:
+                raise ValueError('The rows of %s in %s end inside a row' % (table, self.path))
+        finally:
+            dump.close()
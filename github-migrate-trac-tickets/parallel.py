@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Run CPU bound conversion work in worker processes while keeping the input
+# order, so the results can be emitted exactly as a serial loop would.
+
+import multiprocessing
+from collections import deque
+from itertools import islice
+
+import instrument
+
+# Set in each worker process by _init_worker.  Workers are forked, so the
+# function (and everything it references, e.g. the revision map) is shared
+# copy-on-write instead of being pickled for every task.
+_worker_func = None
+
+
+def _init_worker(func):
+    global _worker_func
+    _worker_func = func
+    # Drop the measurements inherited from the parent
+    instrument.stats.take()
+
+
+def _run_chunk(chunk):
+    # The phases measured in the worker travel back with the results
+    results = [_worker_func(item) for item in chunk]
+    return results, instrument.stats.take()
+
+
+def ordered_map(func, iterable, jobs=1, chunksize=64, window=None):
+    """Yield func(item) for every item of iterable, in input order.
+
+    With jobs > 1 the items are sent in chunks of chunksize to a pool of
+    jobs worker processes.  At most window chunks are in flight at any time,
+    so the input is consumed lazily and memory stays bounded however long
+    the input is.
+    """
+    if jobs <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+    if window is None:
+        window = 4 * jobs
+    pool = multiprocessing.Pool(jobs, _init_worker, (func,))
+    try:
+        items = iter(iterable)
+        pending = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                chunk = list(islice(items, chunksize))
+                if chunk:
+                    pending.append(pool.apply_async(_run_chunk, (chunk,)))
+                else:
+                    exhausted = True
+            if not pending:
+                break
+            results, phases = pending.popleft().get()
+            instrument.stats.merge(phases)
+            for result in results:
+                yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# Map source repository revisions (svn numbers, hg/git hashes) to git commits.
+
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+from collections import namedtuple
+
+Repository = namedtuple('Repository', 'name type rev_map_file')
+
+# Shortest abbreviation of a hash that is looked up by prefix.
+MIN_PREFIX = 6
+
+# Compiled maps are stored next to the map file, e.g. revision.map.idx.  The
+# header records the size, mtime and SHA1 of the map file the index was built
+# from, followed by the record counts; the key and value tables follow it.
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = 'TRACRMI1'
+_INDEX_HEADER = struct.Struct('<8sQd20sQII')
+IndexHeader = namedtuple('IndexHeader', 'magic size mtime sha1 count key_width value_width')
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            digest.update(block)
+    return digest.digest()
+
+
+def _read_index_header(index_file):
+    try:
+        with open(index_file, 'rb') as f:
+            header = IndexHeader._make(_INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size)))
+    except (IOError, struct.error):
+        return None
+    if header.magic != INDEX_MAGIC:
+        return None
+    return header
+
+
+class AmbiguousRevision(KeyError):
+    """An abbreviated revision matches more than one source revision."""
+
+
+class RevisionIndex(object):
+    """Sorted table of (source id, git id) pairs with prefix lookup.
+
+    Keys and values are each stored in one string of fixed width records,
+    padded with NUL bytes, instead of one dict entry (and string object) per
+    key.  Lookups are binary searches over the records.
+
+    An index can be written to disk and memory mapped again by later runs,
+    see load().
+    """
+    # Hex SHA1 of the map file the index was built from, if any.
+    fingerprint = None
+
+    def __init__(self, keys, values, key_width, value_width):
+        self.keys = keys
+        self.values = values
+        self.key_width = key_width
+        self.value_width = value_width
+        self.count = len(keys) // key_width if key_width else 0
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Build an index from (source id, git id) pairs; later pairs win."""
+        mapping = dict(pairs)
+        key_width = max([len(k) for k in mapping] or [0])
+        value_width = max([len(v) for v in mapping.itervalues()] or [0])
+        keys = []
+        values = []
+        for key in sorted(mapping):
+            keys.append(key.ljust(key_width, '\0'))
+            values.append(mapping[key].ljust(value_width, '\0'))
+        return cls(''.join(keys), ''.join(values), key_width, value_width)
+
+    @classmethod
+    def from_file(cls, rev_map_file):
+        """Read a revision map file with lines like "<source id> => <git id>"."""
+        def pairs():
+            with open(rev_map_file, 'r') as f:
+                for line in f:
+                    src_id, git_id = line.split(' => ')
+                    yield src_id, git_id.rstrip()
+        return cls.from_pairs(pairs())
+
+    @classmethod
+    def load(cls, rev_map_file):
+        """Return the index of rev_map_file, compiled to rev_map_file + INDEX_SUFFIX.
+
+        The compiled index is reused while the map file keeps its size and
+        mtime (or, if only the mtime changed, its SHA1), and is rebuilt
+        otherwise.  It is memory mapped, so opening it does not read the
+        tables into the heap.
+        """
+        index_file = rev_map_file + INDEX_SUFFIX
+        stat = os.stat(rev_map_file)
+        header = _read_index_header(index_file)
+        if header is not None and header.size == stat.st_size and header.mtime == stat.st_mtime:
+            return cls.open(index_file)
+        sha1 = _file_sha1(rev_map_file)
+        if header is not None and header.size == stat.st_size and header.sha1 == sha1:
+            # Touched but not changed, only refresh the recorded mtime
+            with open(index_file, 'r+b') as f:
+                f.write(_INDEX_HEADER.pack(*header._replace(mtime=stat.st_mtime)))
+            return cls.open(index_file)
+        logging.info('Compiling revision map {0} to {1}'.format(rev_map_file, index_file))
+        index = cls.from_file(rev_map_file)
+        index.fingerprint = sha1.encode('hex')
+        try:
+            index.write(index_file, stat.st_size, stat.st_mtime, sha1)
+        except (IOError, OSError) as e:
+            logging.warn('Could not write revision map index {0}: {1}'.format(index_file, e))
+        return index
+
+    @classmethod
+    def open(cls, index_file):
+        """Memory map an index written by write()."""
+        with open(index_file, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = IndexHeader._make(_INDEX_HEADER.unpack(data[:_INDEX_HEADER.size]))
+        if header.magic != INDEX_MAGIC:
+            raise ValueError('Not a revision map index: {0}'.format(index_file))
+        keys_size = header.count * header.key_width
+        values_size = header.count * header.value_width
+        if len(data) != _INDEX_HEADER.size + keys_size + values_size:
+            raise ValueError('Truncated revision map index: {0}'.format(index_file))
+        index = cls(buffer(data, _INDEX_HEADER.size, keys_size),
+                    buffer(data, _INDEX_HEADER.size + keys_size, values_size),
+                    header.key_width, header.value_width)
+        index.fingerprint = header.sha1.encode('hex')
+        index._mmap = data
+        return index
+
+    def write(self, index_file, source_size, source_mtime, source_sha1):
+        """Write the index to index_file; the source fields end up in the header."""
+        tmp_file = '%s.%d.tmp' % (index_file, os.getpid())
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(INDEX_MAGIC, source_size, source_mtime, source_sha1,
+                                           self.count, self.key_width, self.value_width))
+                f.write(self.keys)
+                f.write(self.values)
+            os.rename(tmp_file, index_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def __len__(self):
+        return self.count
+
+    def _key(self, i):
+        return self.keys[i * self.key_width:(i + 1) * self.key_width]
+
+    def _value(self, i):
+        return self.values[i * self.value_width:(i + 1) * self.value_width].rstrip('\0')
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, src_id, default=None):
+        """Return the git id of exactly src_id."""
+        if len(src_id) > self.key_width:
+            return default
+        key = src_id.ljust(self.key_width, '\0')
+        i = self._lower_bound(key)
+        if i < self.count and self._key(i) == key:
+            return self._value(i)
+        return default
+
+    def find(self, prefix):
+        """Return the git id of the only source id starting with prefix.
+
+        Returns None if there is no such source id and raises
+        AmbiguousRevision if there is more than one.
+        """
+        i = self._lower_bound(prefix)
+        if i >= self.count or not self._key(i).startswith(prefix):
+            return None
+        if i + 1 < self.count and self._key(i + 1).startswith(prefix):
+            raise AmbiguousRevision(prefix)
+        return self._value(i)
+
+
+class RevisionMapping(object):
+    def __init__(self, repo_list):
+        self.mappings = {}
+        self.prefix_lookup = {}
+        self.ambiguous = set()
+        self.rx_revlink = re.compile(r'((^|\s)r|(c|C)ommit |(r|R)evision |\[)(?P<id>([0-9a-f]{6,40})|([0-9]+))(/(?P<suffix>\w+))?\]?')
+        for repo in repo_list:
+            logging.info('Reading revision mapping for "{0}" from {1}'.format(repo.name, repo.rev_map_file))
+            self.mappings[repo.name] = RevisionIndex.load(repo.rev_map_file)
+            # Links to hg/git revisions may use abbreviated hashes.
+            self.prefix_lookup[repo.name] = repo.type == 'hg' or repo.type == 'git'
+        # Identifies the repositories and the content of their maps
+        digest = hashlib.sha1()
+        for name in sorted(self.mappings):
+            digest.update('%s:%s:%s\n' % (name, self.prefix_lookup[name], self.mappings[name].fingerprint))
+        self.fingerprint = digest.hexdigest()
+
+    def _sub(self, match):
+        src_id = match.group('id').encode('ascii')
+        repo_suffix = match.group('suffix')
+        if repo_suffix is None:
+            repo_suffix = 'main'
+        try:
+            mapping = self.mappings[repo_suffix]
+        except KeyError:
+            raise ValueError('Unspecified repository suffix: {0}'.format(repo_suffix))
+        git_id = mapping.get(src_id)
+        if git_id is None and self.prefix_lookup[repo_suffix] and len(src_id) >= MIN_PREFIX:
+            try:
+                git_id = mapping.find(src_id)
+            except AmbiguousRevision:
+                if (repo_suffix, src_id) not in self.ambiguous:
+                    self.ambiguous.add((repo_suffix, src_id))
+                    logging.warn('Ambiguous revision {0} in repository "{1}"; not converted'.format(src_id, repo_suffix))
+        if git_id is None:
+            return match.group(0)
+        return git_id
+
+    def convert(self, text):
+        return self.rx_revlink.sub(self._sub, text)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Generate a synthetic Trac SQLite database for testing and benchmarking the
+# migration scripts, together with a matching revision map and author files.
+#
+# The data imitates a real project: wiki markup with code blocks, links,
+# revision and ticket references, a heavy tailed number of comments per
+# ticket (a few tickets have hundreds, some with pasted logs), field changes
+# and several versions per wiki page.  The output is deterministic for a
+# given --seed.
+
+import logging
+import os
+import random
+import sqlite3
+from optparse import OptionParser
+
+SCHEMA = """
+CREATE TABLE ticket (id integer PRIMARY KEY, type text, time integer, changetime integer,
+    component text, severity text, priority text, owner text, reporter text, cc text,
+    version text, milestone text, status text, resolution text, summary text,
+    description text, keywords text);
+CREATE TABLE ticket_change (ticket integer, time integer, author text, field text,
+    oldvalue text, newvalue text);
+CREATE TABLE milestone (name text PRIMARY KEY, due integer, completed integer, description text);
+CREATE TABLE enum (type text, name text, value text);
+CREATE TABLE wiki (name text, version integer, time integer, author text, ipnr text,
+    text text, comment text, readonly integer);
+"""
+
+# The keys Trac itself defines; databases converted with mysql2sqlite.sh lack them.
+INDEXES = """
+CREATE UNIQUE INDEX ticket_change_pk ON ticket_change (ticket, time, field);
+CREATE UNIQUE INDEX enum_pk ON enum (type, name);
+CREATE UNIQUE INDEX wiki_pk ON wiki (name, version);
+CREATE INDEX ticket_time_idx ON ticket (time);
+CREATE INDEX wiki_time_idx ON wiki (time);
+"""
+
+ENUMS = [
+    ('priority', ['blocker', 'critical', 'major', 'minor', 'trivial']),
+    ('resolution', ['fixed', 'invalid', 'wontfix', 'duplicate', 'worksforme']),
+    ('severity', ['blocker', 'critical', 'major', 'normal', 'minor', 'trivial']),
+    ('ticket_type', ['defect', 'enhancement', 'task']),
+]
+# Trac's default workflow: the statuses a ticket can go to from each status
+STATUS_CHANGES = {
+    'new': ['assigned', 'accepted', 'closed'],
+    'assigned': ['accepted', 'closed'],
+    'accepted': ['assigned', 'closed'],
+    'closed': ['reopened'],
+    'reopened': ['assigned', 'accepted', 'closed'],
+}
+COMPONENTS = ['core', 'python', 'octave', 'docs', 'build', 'examples']
+WORDS = ('the solver fails when matrix sparse symbolic function jacobian returns wrong value '
+         'for this input after update crash compile error warning option interface class '
+         'derivative evaluation memory leak nlp integrator documentation example').split()
+EPOCH = 1262304000  # 2010-01-01
+
+
+class Generator(object):
+    """Random Trac content; rnd is a random.Random."""
+
+    def __init__(self, rnd, tickets, revisions, users):
+        self.rnd = rnd
+        self.tickets = tickets
+        self.revisions = revisions
+        self.users = users
+
+    def sentence(self, n=None):
+        rnd = self.rnd
+        words = [rnd.choice(WORDS) for _ in range(n or rnd.randint(4, 16))]
+        return ' '.join(words).capitalize() + '.'
+
+    def revision(self):
+        return self.rnd.randint(1, self.revisions)
+
+    def markup_line(self):
+        rnd = self.rnd
+        kind = rnd.random()
+        if kind < 0.45:
+            return self.sentence()
+        if kind < 0.55:
+            return u'%s r%d %s' % (self.sentence(3), self.revision(), self.sentence(3))
+        if kind < 0.62:
+            return u'Fixed in [%d], see also changeset:%d.' % (self.revision(), self.revision())
+        if kind < 0.70:
+            return u'Duplicate of #%d, related to ticket:%d.' % (rnd.randint(1, self.tickets), rnd.randint(1, self.tickets))
+        if kind < 0.75:
+            return u"The '''%s''' option is ''%s''." % (rnd.choice(WORDS), rnd.choice(WORDS))
+        if kind < 0.80:
+            return u'See [http://example.org/%s the %s page] or [wiki:%s].' % (rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(WORDS).capitalize())
+        if kind < 0.84:
+            return u'Look at source:/trunk/casadi/%s.cpp@%d#L%d' % (rnd.choice(WORDS), self.revision(), rnd.randint(1, 900))
+        if kind < 0.88:
+            return u'Call {{{%s(x < y)}}} first.' % rnd.choice(WORDS)
+        if kind < 0.92:
+            return u' * %s' % self.sentence(5)
+        if kind < 0.95:
+            return u'== %s ==' % self.sentence(3)
+        if kind < 0.97:
+            return u'[[Image(%s.png)]] [[br]] attachment:%s.patch' % (rnd.choice(WORDS), rnd.choice(WORDS))
+        return u'Unicode: caf\xe9 → na\xefve'
+
+    def code_block(self):
+        rnd = self.rnd
+        lines = [u'{{{', u'#!python']
+        for _ in range(rnd.randint(2, 12)):
+            lines.append(u'x = %s(%d) < %d' % (rnd.choice(WORDS), rnd.randint(0, 99), rnd.randint(0, 99)))
+        lines.append(u'}}}')
+        return lines
+
+    def log_paste(self):
+        lines = [u'{{{']
+        for i in range(self.rnd.randint(50, 400)):
+            lines.append(u'[%05d] WARNING %s' % (i, self.sentence(8)))
+        lines.append(u'}}}')
+        return lines
+
+    def text(self, lines=None):
+        rnd = self.rnd
+        out = []
+        for _ in range(lines or rnd.randint(1, 12)):
+            if rnd.random() < 0.08:
+                out.extend(self.code_block())
+            else:
+                out.append(self.markup_line())
+        if rnd.random() < 0.01:
+            out.extend(self.log_paste())
+        return u'\n'.join(out)
+
+    def comment_count(self):
+        """Heavy tailed: most tickets have a few comments, some hundreds."""
+        rnd = self.rnd
+        if rnd.random() < 0.002:
+            return rnd.randint(150, 600)
+        return int(rnd.paretovariate(1.3)) - 1 + rnd.randint(0, 3)
+
+
+def generate(path, tickets, revisions, users, wiki_pages, seed=0, indexes=True):
+    rnd = random.Random(seed)
+    gen = Generator(rnd, tickets, revisions, users)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    if indexes:
+        conn.executescript(INDEXES)
+    conn.execute('PRAGMA synchronous=OFF')
+
+    for type_, names in ENUMS:
+        conn.executemany('INSERT INTO enum VALUES (?, ?, ?)',
+                         [(type_, name, str(i + 1)) for i, name in enumerate(names)])
+    milestones = ['%d.%d' % (1 + i // 10, i % 10) for i in range(max(3, tickets // 500))]
+    conn.executemany('INSERT INTO milestone VALUES (?, ?, ?, ?)', [
+        (name, EPOCH + i * 2592000, EPOCH + i * 2592000 if i < len(milestones) - 2 else 0, gen.text(2))
+        for i, name in enumerate(milestones)])
+
+    span = 8 * 365 * 86400
+
+    def ticket_rows():
+        for tid in range(1, tickets + 1):
+            created = EPOCH + span * tid // (tickets + 1)
+            status = rnd.choice(['new', 'assigned', 'closed', 'closed', 'closed'])
+            yield (tid, rnd.choice(['defect', 'defect', 'enhancement', 'task']), created, created + rnd.randint(60, 86400 * 30),
+                   rnd.choice(COMPONENTS), 'normal', rnd.choice(ENUMS[0][1]), rnd.choice(users + [u'', u'somebody']),
+                   rnd.choice(users), u'', u'', rnd.choice(milestones + [u'']), status,
+                   rnd.choice(ENUMS[1][1]) if status == 'closed' else u'', gen.sentence(8), gen.text(), u'')
+    conn.executemany('INSERT INTO ticket VALUES (%s)' % ', '.join('?' * 17), ticket_rows())
+
+    # The values each changed field takes; the resolution changes with the status
+    domains = {'owner': users + [u''], 'milestone': milestones + [u''], 'priority': ENUMS[0][1]}
+
+    def change_rows():
+        for tid in range(1, tickets + 1):
+            created = EPOCH + span * tid // (tickets + 1)
+            when = created
+            # Field values as the ticket was created, changed from there on
+            values = {'status': u'new', 'owner': u'', 'milestone': u'', 'priority': u'major', 'resolution': u''}
+            for cnum in range(1, gen.comment_count() + 1):
+                when += rnd.randint(60, 86400 * 3)
+                author = rnd.choice(users)
+                yield (tid, when, author, u'comment', str(cnum), gen.text(rnd.randint(1, 6)))
+                if rnd.random() < 0.25:
+                    field = rnd.choice(['status', 'owner', 'milestone', 'priority'])
+                    if field == 'status':
+                        new = rnd.choice(STATUS_CHANGES[values[field]])
+                    else:
+                        new = rnd.choice([value for value in domains[field] if value != values[field]])
+                    yield (tid, when, author, field, values[field], new)
+                    values[field] = new
+                    if field == 'status' and (new == 'closed' or values['resolution']):
+                        resolution = rnd.choice(ENUMS[1][1]) if new == 'closed' else u''
+                        yield (tid, when, author, u'resolution', values['resolution'], resolution)
+                        values['resolution'] = resolution
+    conn.executemany('INSERT INTO ticket_change VALUES (?, ?, ?, ?, ?, ?)', change_rows())
+
+    def wiki_rows():
+        names = ['WikiStart'] + ['%s%s' % (rnd.choice(WORDS).capitalize(), rnd.choice(WORDS).capitalize()) + str(i)
+                                 for i in range(wiki_pages - 1)]
+        for name in names:
+            when = EPOCH + rnd.randint(0, span)
+            for version in range(1, rnd.randint(1, 15) + 1):
+                when += rnd.randint(60, 86400 * 30)
+                yield (name, version, when, rnd.choice(users), u'127.0.0.1', gen.text(rnd.randint(5, 40)),
+                       gen.sentence(4) if rnd.random() < 0.6 else None, 0)
+    conn.executemany('INSERT INTO wiki VALUES (?, ?, ?, ?, ?, ?, ?, ?)', wiki_rows())
+    conn.commit()
+    conn.close()
+
+
+def write_maps(prefix, revisions, users, seed=0):
+    """Write prefix.revmap (svn revision => sha1) and the author files."""
+    rnd = random.Random(seed)
+    with open(prefix + '.revmap', 'w') as f:
+        for rev in range(1, revisions + 1):
+            f.write('%d => %040x\n' % (rev, rnd.getrandbits(160)))
+    # trac-tickets-to-gh.py wants "trac_user = github_user",
+    # wiki-to-gh.py "trac_user = github_user <email>"
+    with open(prefix + '.authors', 'w') as f:
+        for user in users:
+            f.write('%s = %s\n' % (user, user.replace('.', '_')))
+    with open(prefix + '.wiki-authors', 'w') as f:
+        for user in users:
+            f.write('%s = %s <%s@example.org>\n' % (user, user.replace('.', '_'), user))
+
+
+if __name__ == '__main__':
+    usage = """
+      %prog [options] trac_db_path
+
+      Writes trac_db_path and, next to it, trac_db_path.revmap, trac_db_path.authors
+      (for trac-tickets-to-gh.py) and trac_db_path.wiki-authors (for wiki-to-gh.py).
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option('-n', '--tickets', type='int', default=1000,
+                      help='Number of tickets (default: 1000)')
+    parser.add_option('--revisions', type='int', default=None,
+                      help='Number of svn revisions (default: 2 per ticket)')
+    parser.add_option('--users', type='int', default=50,
+                      help='Number of distinct users (default: 50)')
+    parser.add_option('--wiki-pages', type='int', default=None,
+                      help='Number of wiki pages (default: 1 per 20 tickets)')
+    parser.add_option('--seed', type='int', default=0,
+                      help='Random seed (default: 0)')
+    parser.add_option('--no-indexes', action='store_true', default=False,
+                      help='Leave out the keys, like a database converted with mysql2sqlite.sh (default: false)')
+    (options, args) = parser.parse_args()
+    try:
+        trac_db_path, = args
+    except ValueError:
+        parser.error('Wrong number of arguments')
+    logging.basicConfig(level=logging.INFO, format='%(levelname)9s: %(message)s')
+
+    revisions = options.revisions or 2 * options.tickets
+    wiki_pages = options.wiki_pages or max(1, options.tickets // 20)
+    users = ['user%d' % i for i in range(options.users)]
+    logging.info('Generating {0} with {1} tickets and {2} wiki pages'.format(trac_db_path, options.tickets, wiki_pages))
+    generate(trac_db_path, options.tickets, revisions, users, wiki_pages,
+             seed=options.seed, indexes=not options.no_indexes)
+    write_maps(trac_db_path, revisions, users, seed=options.seed)
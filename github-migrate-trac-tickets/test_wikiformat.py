@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Golden test of the wiki markup converters: wikiformat-golden.json holds
+# representative markup and what the convert_wikiformat functions of
+# trac-tickets-to-gh.py and wiki-to-gh.py made of it before wikiformat.py
+# replaced them.  Run with: python -m unittest test_wikiformat
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from revmap import RevisionMapping, Repository
+from ticketmap import TicketMapping
+from wikiformat import TicketFormatConverter, WikiPageFormatConverter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class GoldenTest(unittest.TestCase):
+    longMessage = True
+
+    def setUp(self):
+        # The revision maps the expected outputs were made with
+        self.tmpdir = tempfile.mkdtemp()
+        main_map = os.path.join(self.tmpdir, 'main.map')
+        with open(main_map, 'w') as f:
+            f.writelines('%d => %040x\n' % (i, i * 7919) for i in range(1, 101))
+        hg_map = os.path.join(self.tmpdir, 'hg.map')
+        with open(hg_map, 'w') as f:
+            f.writelines('%040x => %040x\n' % (i * 104729, i * 7919) for i in range(1, 101))
+        self.rev_mapping = RevisionMapping([Repository('main', 'svn', main_map), Repository('hg', 'hg', hg_map)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_golden(self):
+        converters = {'ticket': TicketFormatConverter(), 'wiki': WikiPageFormatConverter()}
+        with open(os.path.join(HERE, 'wikiformat-golden.json')) as f:
+            cases = json.load(f)
+        for case in cases:
+            kwargs = {'rev_mapping': self.rev_mapping if case['revisions'] else None, 'title': case['title']}
+            if case['flavour'] == 'wiki':
+                kwargs['mainpage'] = case['mainpage']
+            self.assertEqual(converters[case['flavour']](case['text'], **kwargs), case['expected'],
+                             '{0} converter, {1!r}'.format(case['flavour'], kwargs))
+
+    def test_ticket_references_in_headings(self):
+        # The # of headings made from =...= are not taken for ticket references
+        ticket_mapping = TicketMapping({3: 77, 12: 99})
+        for converter in (TicketFormatConverter(), WikiPageFormatConverter()):
+            self.assertEqual(converter(u'=12=', ticket_mapping=ticket_mapping), u'####12')
+            self.assertEqual(converter(u'== 3 ==', ticket_mapping=ticket_mapping), u'## 3 ')
+            self.assertEqual(converter(u'= See #3 =\n#12 is fixed', ticket_mapping=ticket_mapping),
+                             u'# See #77 \n#99 is fixed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Map Trac ticket ids to the numbers of the GitHub issues they become.
+
+import hashlib
+import re
+
+
+class TicketMapping(object):
+    """Rewrite ticket references with a {ticket id: issue number} table.
+
+    #N, ticket:N and comment:M:ticket:N (also in [...] links with a label)
+    become references to the issue of ticket N.  Tickets that are not
+    migrated are named "Trac ticket N" instead, so they do not link to an
+    unrelated issue.
+    """
+    rx_ticket_ref = re.compile(
+        r'\[(?:comment:(?P<lcomment>\d+):)?ticket:(?P<lid>\d+)(?: (?P<label>[^\]]*))?\]'
+        r'|(?:comment:(?P<comment>\d+):)?ticket:(?P<id>\d+)'
+        r'|(?<![\w&/#!])#(?P<hid>\d+)\b')
+
+    def __init__(self, numbers):
+        self.numbers = numbers
+        # Identifies the content of the table
+        digest = hashlib.sha1()
+        for item in sorted(numbers.iteritems()):
+            digest.update('%d:%d\n' % item)
+        self.fingerprint = digest.hexdigest()
+
+    def get(self, tid):
+        return self.numbers.get(tid)
+
+    def _sub(self, match):
+        tid = match.group('lid') or match.group('id') or match.group('hid')
+        comment = match.group('lcomment') or match.group('comment')
+        number = self.numbers.get(int(tid))
+        if number is None:
+            ref = u'Trac ticket {0}'.format(tid)
+        else:
+            ref = u'#{0}'.format(number)
+        if comment:
+            ref = u'{0} (comment {1})'.format(ref, comment)
+        if match.group('label'):
+            ref = u'{0} ({1})'.format(match.group('label'), ref)
+        return ref
+
+    def convert(self, text):
+        return self.rx_ticket_ref.sub(self._sub, text)
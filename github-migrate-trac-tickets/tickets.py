@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+# Migrate trac tickets from DB into GitHub using v3 API.
+# Transform milestones to milestones, components to labels.
+# The code merges milestones and labels does NOT attempt to prevent
+# duplicating tickets so you'll get multiples if you run repeatedly,
+# unless the same --journal file is given to every run.
+# See API docs: http://developer.github.com/v3/issues/
+
+# TODO:
+# - should I be migrating Trac 'keywords' to Issue 'labels'?
+# - list Trac users, get GitHub collaborators, define a mapping for issue assignee.
+
+from collections import deque
+import logging
+from getpass import getpass
+import time
+
+from instrument import stats, utf8_size
+from parallel import ordered_map
+from ticketmap import TicketMapping
+from trac import epoch_to_iso
+from wikiformat import TicketFormatConverter
+
+convert_wikiformat = TicketFormatConverter()
+
+# GitHub rejects issue and comment bodies longer than this
+MAX_BODY_LENGTH = 65536
+
+class BodyBuilder(object):
+    """Collect the parts of an issue body and join them once at the end.
+
+    Parts that do not fit into the body any more go into follow-up
+    comments, which are limited to limit characters as well.  A part is
+    only split if it is too long on its own, preferably at a line break.
+    """
+    continued = u'*(continued)*\n\n'
+
+    def __init__(self, limit=MAX_BODY_LENGTH):
+        self.limit = limit
+        self.chunks = [[]]
+        self.size = 0
+        self.empty_size = 0
+
+    def _next_chunk(self):
+        self.chunks.append([self.continued])
+        self.size = self.empty_size = len(self.continued)
+
+    def add(self, text):
+        while self.size + len(text) > self.limit:
+            if self.size > self.empty_size:
+                self._next_chunk()
+                continue
+            room = self.limit - self.size
+            cut = text.rfind(u'\n', 0, room) + 1 or room
+            self.chunks[-1].append(text[:cut])
+            text = text[cut:]
+            self._next_chunk()
+        self.chunks[-1].append(text)
+        self.size += len(text)
+
+    def build(self):
+        """Return (body, [follow-up comment bodies])."""
+        texts = [u''.join(chunk) for chunk in self.chunks]
+        return texts[0], texts[1:]
+
+class TicketConverter(object):
+    """Turn a ticket row and its comments into a GitHub issue.
+
+    Instances only hold the lookup tables, so they can be run in worker
+    processes (see parallel.ordered_map).  The comments and field changes
+    are quoted in the issue body, or with separate_comments each become a
+    comment of their own.
+    """
+    columns = ['id', 'summary', 'description', 'owner', 'milestone', 'component', 'status', 'time',
+               'changetime', 'reporter', 'keywords', 'severity', 'priority', 'resolution', 'type']
+
+    def __init__(self, author_mapping, rev_mapping, milestone_id, ticket_mapping=None, attachments=None,
+                 separate_comments=False):
+        self.author_mapping = author_mapping
+        self.rev_mapping = rev_mapping
+        self.milestone_id = milestone_id
+        self.ticket_mapping = ticket_mapping
+        self.attachments = attachments
+        self.separate_comments = separate_comments
+
+    def __call__(self, ticket):
+        """Return (ticket id, status, issue, comments) for a (row, changes) pair.
+
+        The comments are {'body': ..., 'created_at': ...} dicts: first what
+        did not fit into the issue body, then the separate comments.
+        """
+        with stats.timer('convert') as measurement:
+            tid, status, issue, comments = self.convert(ticket)
+            measurement.bytes = (utf8_size(issue['title']) + utf8_size(issue['body']) +
+                                 sum(utf8_size(comment['body']) for comment in comments))
+        return tid, status, issue, comments
+
+    def convert(self, ticket):
+        (tid, summary, description, owner, milestone, component, status, \
+             created_at, updated_at, reporter, keywords, severity, priority, resolution, type_), changes = ticket
+        if description:
+            description = description.strip()
+        if milestone:
+            milestone = milestone.strip()
+        attachments = self.attachments.bind('ticket', tid) if self.attachments is not None else None
+        issue = {'title': convert_wikiformat(summary,rev_mapping=self.rev_mapping,title=True,ticket_mapping=self.ticket_mapping)}
+        body = BodyBuilder()
+        if description:  
+            body.add(convert_wikiformat(description,rev_mapping=self.rev_mapping,ticket_mapping=self.ticket_mapping,
+                                        attachments=attachments))
+        if milestone:
+            m = self.milestone_id.get(milestone)
+            if m:
+                issue['milestone'] = m
+        # Don't add component as label -- only one component in dest repo, so redundant
+        #if component:
+        #    if component not in labels:
+        #        # GitHub creates the 'url' and 'color' fields for us
+        #        github.labels(data={'name': component})
+        #        labels[component] = 'CREATED' # keep track of it so we don't re-create it
+        #        logging.debug("adding component as new label=%s" % component)
+        #    issue['labels'] = [component]
+        #    issue['labels'] = [{'name' : componenet}]
+        # We have to create/map Trac users to GitHub usernames before we can assign
+        # them to tickets
+        reporter_login = self.author_mapping(reporter)['login']
+        issue['creator'] = reporter_login
+        
+        if owner and not(self.author_mapping(owner)['login']=='None'):
+            issue['assignee'] = self.author_mapping(owner)['login']
+        issue['labels'] = []
+        # We don't migrate keywords and did not use severity.
+        #if keywords:
+        #    for keyword in parse_keywords(keywords):
+        #        issue['labels'].append({'name': keyword})
+        #if severity:
+        #    issue['labels'].append({'name': severity})
+        if priority:
+            issue['labels'].append({'name': priority})
+        if resolution:
+            issue['labels'].append({'name': resolution})
+        if type_:
+            if type_ == 'defect':
+                type_ = 'bug'  # convert to GH's default label.
+            issue['labels'].append({'name': type_})
+
+        body.add(u'\n\n*Created by [{0}](/{0}) at: {1}*\n'.format(reporter_login,epoch_to_iso(created_at)))
+        body.add(u'*Last updated at: {0}*\n'.format(epoch_to_iso(updated_at)))
+        if attachments is not None and attachments.filenames:
+            body.add(u'*Attachments: {0}*\n'.format(u', '.join(attachments.links())))
+        
+        issue['created_at'] = epoch_to_iso(created_at).split(".")[0]+"Z"
+        issue['updated_at'] = epoch_to_iso(updated_at).split(".")[0]+"Z"
+
+        # Add comments and field changes
+        comments = []
+        comment_count = 0
+        for timestamp, author, text, fields in changes:
+            text = (text or u'').strip()
+            field_changes = [self.field_change(*field) for field in fields if not field[0].startswith('_')]
+            if not text and not field_changes:
+                continue
+            commented_at = issue['created_at']
+            if timestamp:
+                timestamp = epoch_to_iso(timestamp)
+                commented_at = timestamp.split(".")[0] + "Z"
+            login = self.author_mapping(author)['login']
+            # Don't worry about escaping--GitHub will handle these with Markdown formatter.
+            if text:
+                comment_count += 1
+                text = convert_wikiformat(text,rev_mapping=self.rev_mapping,ticket_mapping=self.ticket_mapping,
+                                          attachments=attachments)
+                logging.debug(u'  comment: {0}'.format(text[:70].replace(u'\r\n', u'\\n').replace(u'\n', u'\\n')))
+                header = u'*Comment {2} by [{0}](/{0}) at {1}*\n- - -'.format(login, timestamp, comment_count)
+            else:
+                header = u'*Changed by [{0}](/{0}) at {1}*\n- - -'.format(login, timestamp)
+            lines = [header]
+            if field_changes:
+                lines.extend(field_changes)
+                if text:
+                    lines.append(u'')
+            if text:
+                lines.append(text)
+            if self.separate_comments:
+                # Converted and limited in length on its own, whatever the size of the thread
+                comment = BodyBuilder()
+                comment.add(u'\n'.join(lines))
+                first, rest = comment.build()
+                comments.extend({'body': part, 'created_at': commented_at} for part in [first] + rest)
+                continue
+            # Quote every line of the comment
+            body.add(u'\n- - -\n> ' + u'\n'.join(lines).replace(u'\n', u'\n> ') + u'\n')
+
+        issue['body'], follow_ups = body.build()
+        if follow_ups:
+            logging.info(u"Ticket {0} is too long; continuing it in {1} comments".format(tid, len(follow_ups)))
+        comments[:0] = [{'body': follow_up, 'created_at': issue['created_at']} for follow_up in follow_ups]
+        return tid, status, issue, comments
+
+    def field_change(self, field, oldvalue, newvalue):
+        """Describe a change of a ticket field as a Markdown list item."""
+        if field in ('description', 'cc'):
+            return u' * **{0}** changed'.format(field)
+        if field in ('owner', 'reporter'):
+            oldvalue = oldvalue and self.author_mapping(oldvalue)['login']
+            newvalue = newvalue and self.author_mapping(newvalue)['login']
+        elif field == 'summary':
+            oldvalue = oldvalue and convert_wikiformat(oldvalue, rev_mapping=self.rev_mapping, title=True, ticket_mapping=self.ticket_mapping)
+            newvalue = newvalue and convert_wikiformat(newvalue, rev_mapping=self.rev_mapping, title=True, ticket_mapping=self.ticket_mapping)
+        if not oldvalue:
+            return u' * **{0}** set to `{1}`'.format(field, newvalue)
+        if not newvalue:
+            return u' * **{0}** `{1}` deleted'.format(field, oldvalue)
+        return u' * **{0}** changed from `{1}` to `{2}`'.format(field, oldvalue, newvalue)
+
+def migrate(options, trac, author_mapping, rev_mapping, github_username, github_repo, cache=None):
+    """Migrate the labels, milestones and tickets selected by options to github_repo.
+
+    Returns the TicketMapping of the issue numbers the tickets became.
+    """
+    global convert_wikiformat
+    from github import API_URL, GitHub, GitHubError, AlreadyExists, DoesNotExist
+    from journal import Journal
+
+    if options.json:
+        if options.json_format == 'files':
+            from github_json import GitHubJson
+            github = GitHubJson(github_repo, dry_run=options.dry_run)
+        else:
+            from github_json import GitHubJsonStream
+            github = GitHubJsonStream(github_repo, format=options.json_format,
+                                      compress=options.gzip, dry_run=options.dry_run)
+    else:
+        github_password = getpass('Password for user {0}: '.format(github_username))
+        github = GitHub(github_username, github_password, github_repo,
+                        dry_run=options.dry_run, api_url=options.github_api or API_URL,
+                        concurrency=options.concurrency)
+
+    # Without a file, the journal only lives as long as this run
+    journal = Journal(options.journal or ':memory:', github_repo, dry_run=options.dry_run)
+
+    def check_number(tid, number, planned):
+        if number != planned.get(tid) and not options.dry_run:
+            logging.warn('Ticket {0} became issue {1} instead of {2}; references to later tickets will be wrong'.format(
+                tid, number, planned.get(tid)))
+
+    def created_issue(tid, issue, planned):
+        """Return the number of the issue an interrupted run created for a ticket, or None."""
+        if tid not in creating or options.json:
+            # JSON output is simply written again
+            return None
+        try:
+            existing = github.issues(planned[tid])
+        except DoesNotExist:
+            return None
+        return existing['number'] if existing['title'] == issue['title'] else None
+
+    def record_imports(results, planned):
+        for tid, number, errors in results:
+            if number is None:
+                logging.error(u'GitHub could not import the issue of ticket {0}: {1}'.format(tid, errors))
+            else:
+                logging.debug('Imported issue no.: {0} => {1}'.format(tid, number))
+                if planned:
+                    check_number(tid, number, planned)
+            journal.import_done(tid, number)
+
+    importer = None
+    if options.import_api:
+        from issueimport import IssueImporter, import_request
+        importer = IssueImporter(github, window=options.import_window)
+        # The issues of imports an interrupted run submitted are planned already
+        pending = journal.pending_imports()
+        if pending:
+            logging.info("Waiting for {0} issue imports submitted by an earlier run".format(len(pending)))
+            for tid, import_id in pending:
+                importer.resume(tid, import_id)
+            record_imports(importer.finished(wait=True), {})
+
+    unmapped = author_mapping.resolve(trac.ticket_usernames())
+    if unmapped:
+        logging.warn(u'{0} Trac users have no GitHub login in the authors file and become "None": {1}'.format(
+            len(unmapped), u', '.join(unmapped)))
+
+    if cache is not None:
+        from convcache import CachedConverter
+        # Used by TicketConverter too, also in worker processes
+        convert_wikiformat = CachedConverter(TicketFormatConverter(), cache)
+
+    # Show the Trac usernames assigned to tickets as an FYI
+
+    #logging.info("Getting Trac ticket owners (will NOT be mapped to GitHub username)...")
+    #for (username,) in trac.sql('SELECT DISTINCT owner FROM ticket'):
+    #    if username:
+    #        username = username.split(',')[0].strip() # username returned is tuple like: ('phred',)
+    #        logging.debug("Trac ticket owner: %s" % username)
+
+    def parse_keywords(keywords):
+        if isinstance(keywords, tuple):
+            keywords = ','.join(keywords)
+        if ',' in keywords:
+            keywords = map(lambda k: k.strip(), keywords.split(','))
+        else:
+            keywords = keywords.split(' ')
+        for kwd in keywords:
+            if not kwd.strip():
+                continue
+            yield kwd
+
+    # Get GitHub labels; we'll merge Trac components into them
+    logging.info("Getting existing GitHub labels...")
+    started = time.time()
+    gh_labels = set()
+    for label in github.labels():
+        gh_labels.add(label['name'])
+    logging.info("Getting the set of labels in Trac....")
+    trac_labels = set()
+    trac_label_colors = {
+        'resolution': {
+            'fixed': '228b22',
+            'wontfix': 'bebebe',
+            'duplicate': 'c8c8c8',
+            'invalid': 'aaaaaa',
+            'worksforme': '008c8c',
+            'reqconfirm': 'e16a9d',
+        },
+        'priority': {
+            'blocker': '800000',
+            'critical': 'a52a2a',
+            'major': 'b22222',
+            'minor': 'b90000',
+            'trivial': 'cd5c5c',
+        },
+        'severity': {
+            # Textcube did not use this.
+        },
+        'ticket_type': {
+            'defect': '9400d3',
+            'enhancement': '0064ff',
+        },
+    }
+    trac_label_types = {}
+    for type_, name, value in trac.enums():
+        if name == 'defect': continue  # exception: this is mapped to "bug"
+        trac_label_types[name] = type_  # reverse mapping
+        trac_labels.add(name)
+    # Keywords in Textcube Trac has no clean rules and are too diverged.
+    # We won't migrate them.
+    #for keywords in trac.sql("SELECT keywords FROM ticket"):
+    #    if keywords is None:
+    #        continue
+    #    for kwd in parse_keywords(keywords):
+    #        trac_labels.add(kwd)
+    for name in (gh_labels | trac_labels):
+        logging.debug(u"label name={0}".format(name))
+    logging.info("Adding undefine labels to GitHub...")
+    # Add (undefined) labels
+    created_labels = []
+    for name in (trac_labels - gh_labels):
+        try:
+            color = trac_label_colors[trac_label_types[name]][name]
+        except KeyError:
+            color = 'e8e8e8'
+        created_labels.append(github.submit(github.labels, data={
+            'name': name,
+            'color': color,
+        }))
+    for future in created_labels:
+        future.result()
+    stats.add('labels', time.time() - started, len(created_labels))
+
+    # == Planning ==
+    # GitHub numbers issues in creation order, so the issue number of every
+    # ticket is known before anything is written, and references to tickets
+    # can be rewritten while converting.
+    migrated = journal.issue_numbers()
+    # Issues created by an earlier run whose comments or closing are missing
+    unfinished = dict(journal.unfinished_issues())
+    # Issues an earlier run was creating when it was interrupted: GitHub may
+    # have created them, so they keep the numbers they were planned as
+    creating = journal.creating_issues()
+    first_number = number = (options.first_issue_number or (creating and min(creating.values())) or
+                             github.next_issue_number())
+    numbers = dict(migrated)
+    selection = options.selection
+    selected = trac.ticket_ids(selection)
+    for tid in selected:
+        if tid in migrated:
+            continue
+        numbers[tid] = number
+        number += 1
+    ticket_mapping = TicketMapping(numbers)
+    logging.info("Tickets will become issues {0} to {1}".format(first_number, number - 1))
+    if options.shards:
+        shard, shards = options.shards
+        # Every shard plans all selected tickets, so references across
+        # shards are rewritten alike, but only migrates its own id range.
+        selected = selected[len(selected) * (shard - 1) // shards:len(selected) * shard // shards]
+        selection = selection.narrow(selected[0], selected[-1]) if selected else selection.narrow(1, 0)
+        shard_numbers = [numbers[tid] for tid in selected if tid not in migrated]
+        if shard_numbers:
+            logging.info("Shard {0}/{1} migrates tickets {2} to {3} into issues {4} to {5}".format(
+                shard, shards, selected[0], selected[-1], shard_numbers[0], shard_numbers[-1]))
+            if options.json:
+                github.start_issues_at(shard_numbers[0])
+    todo = set(tid for tid in selected if tid not in migrated or tid in unfinished)
+    for tid in sorted(set(unfinished) - set(selected)):
+        logging.warn("Issue {0} of ticket {1} was left unfinished by an earlier run; "
+                     "select the ticket again to finish it".format(unfinished[tid], tid))
+
+    # == Attachment Migration ==
+    # GitHub has no API for issue attachments: the files are copied to a
+    # directory that is published at --attachments-url, and linked from there.
+    attachments = None
+    if options.trac_env:
+        from attachments import copy_attachments
+        logging.info("Copying ticket attachments to {0}...".format(options.attachments_dir))
+        attachments = copy_attachments(
+            (a for a in trac.attachments('ticket') if int(a[1]) in todo),
+            options.trac_env, options.attachments_dir, options.attachments_url,
+            workers=options.attachment_workers)
+
+    # == Milestone Migration ==
+    # Get any existing GitHub milestones so we can merge Trac into them.
+    # We need to reference them by numeric ID in tickets.
+    logging.info("Getting existing GitHub milestones...")
+    started = time.time()
+    milestone_id = {}
+    for m in github.milestones():
+        milestone_id[m['title']] = m['number']
+        logging.debug("milestone (open)   title={0}".format(m['title']))
+    # API returns only 'open' issues by default, have to ask for closed like:
+    # curl -u 'USER:PASS' https://api.github.com/repos/USERNAME/REPONAME/milestones?state=closed
+    for m in github.milestones(query='state=closed'):
+        milestone_id[m['title']] = m['number']
+        logging.debug("milestone (closed) title={0}".format(m['title']))
+
+    # We have no way to set the milestone closed date in GitHub.
+    # The 'due' and 'completed' are long ints representing datetimes.
+    logging.info("Migrating Trac milestones to GitHub...")
+    journal_milestones = journal.milestone_numbers()
+    milestones = trac.milestones()
+    created_milestones = []
+    for name, description, due, completed in milestones:
+        name = name.strip()
+        if name in journal_milestones:
+            logging.debug("milestone {0} was migrated by an earlier run".format(name))
+            milestone_id[name] = journal_milestones[name]
+            continue
+        if name in milestone_id:
+            logging.warn("milestone {0} already exists; using it instead of migrated one.".format(name))
+            continue
+        logging.debug("milestone {0} due={1} completed={2}".format(name, due, completed))
+        if name and name not in milestone_id:
+            if completed:
+                state = 'closed'
+            else:
+                state = 'open'
+            milestone = {'title': name,
+                         'state': state,
+                         'description': convert_wikiformat(description, rev_mapping=rev_mapping,
+                                                           ticket_mapping=ticket_mapping),
+                         }
+            if due:
+                milestone['due_on'] = epoch_to_iso(due)
+            logging.debug("milestone: {0}".format(milestone))
+            if options.dry_run:
+                continue
+            created_milestones.append((name, github.submit(github.milestones, data=milestone)))
+    for name, future in created_milestones:
+        try:
+            gh_milestone = future.result()
+            milestone_id[name] = gh_milestone['number']
+            journal.milestone_created(name, gh_milestone['number'])
+        except AlreadyExists:
+            # NOTE: Unfortunately, API does not return the "number"
+            #       property of the duplicate.  We work-around this problem
+            #       by prefetching existing milestone objects above.
+            pass
+    stats.add('milestones', time.time() - started, len(created_milestones))
+
+    # == Ticket Migration ==
+    if len(migrated) > len(unfinished):
+        logging.info("Skipping {0} tickets migrated by an earlier run".format(len(migrated) - len(unfinished)))
+
+    # Issues are numbered in creation order, so they are created one by one.
+    # Closing them does not change the numbering and runs in the background.
+    closing = deque()
+    def finish_closing(wait):
+        while closing and (wait or closing[0][1].done()):
+            tid, future = closing.popleft()
+            try:
+                future.result()
+                journal.issue_finished(tid)
+            except GitHubError as e:
+                logging.error(u'Could not close the issue of ticket {0}: {1}'.format(tid, e))
+
+    convert_ticket = TicketConverter(author_mapping, rev_mapping, milestone_id, ticket_mapping, attachments,
+                                     separate_comments=options.comments == 'separate')
+    # Comments and field changes are read by the same scan, so 'read' covers them too
+    tickets = stats.iterate('read', trac.tickets_with_changes(TicketConverter.columns, history=options.history,
+                                                              selection=selection),
+                            size=lambda (row, changes): utf8_size(row[2]) + sum(utf8_size(c[2]) for c in changes))
+    if migrated:
+        # Unfinished tickets are converted again, to finish their issues
+        tickets = (t for t in tickets if t[0][0] not in migrated or t[0][0] in unfinished)
+    for tid, status, issue, comments in ordered_map(convert_ticket, tickets, jobs=options.jobs):
+        logging.info(u"Ticket {0}: {1}".format(tid, issue['title']))
+        if importer is not None and tid not in unfinished:
+            # The issue, its comments and its state go in one request
+            try:
+                with stats.timer('emit', nbytes=utf8_size(issue['body'])):
+                    import_id = importer.submit(tid, import_request(issue, comments, closed=status == 'closed'))
+                if import_id is not None:
+                    journal.import_submitted(tid, import_id)
+            except (ValueError, GitHubError) as e:
+                logging.error(e)
+            record_imports(importer.finished(), numbers)
+            continue
+        try:
+            number = unfinished.get(tid) or created_issue(tid, issue, numbers)
+            posted = 0
+            if number is None:
+                # Save the issue.
+                # NOTE: we cannot set the issue number when creating.
+                journal.issue_creating(tid, numbers[tid])
+                with stats.timer('emit', nbytes=utf8_size(issue['body'])):
+                    result = github.issues(data=issue)
+                number = result['number']
+                logging.debug('New issue no.: {0} => {1}'.format(tid, number))
+                check_number(tid, number, numbers)
+                # Recorded right away, so that a rerun never creates it again;
+                # it is finished once its comments are posted and it is closed
+                journal.issue_created(tid, number, finished=False)
+            else:
+                if tid in unfinished:
+                    # A resumed issue only gets the comments it is missing
+                    posted = journal.comments_posted(tid)
+                    if posted is None:
+                        posted = len(comments)
+                    elif not options.json:
+                        # The run may have been interrupted right after posting one
+                        posted = max(posted, len(github.issue_comments(number)))
+                else:
+                    journal.issue_created(tid, number, finished=False)
+                logging.info("Finishing issue {0} of ticket {1}, created by an earlier run".format(number, tid))
+            for count, comment in enumerate(comments[posted:], posted + 1):
+                with stats.timer('emit', nbytes=utf8_size(comment['body'])):
+                    github.issue_comments(number, data=comment)
+                journal.comment_posted(tid, count)
+            if status == 'closed':
+                # Unfortunately, we should use another query to close it.
+                closing.append((tid, github.submit(github.issues, number, data={'state': 'closed'})))
+            else:
+                journal.issue_finished(tid)
+        except (ValueError, GitHubError) as e:
+            logging.error(e)  # TEMPORARY
+            continue
+        finish_closing(wait=False)
+    finish_closing(wait=True)
+    if importer is not None:
+        record_imports(importer.finished(wait=True), numbers)
+
+    github.close()
+    journal.close()
+    return ticket_mapping
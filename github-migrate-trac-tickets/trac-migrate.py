@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Migrate a Trac instance to GitHub: the tickets to issues, the wiki to the
+# git repository of the GitHub wiki, or both in one run that reads the Trac
+# database and the author and revision maps only once.
+# See cli.py for the options.
+
+import cli
+
+if __name__ == '__main__':
+    cli.main()
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+# Read tickets, wiki pages and attachments from a Trac SQLite database, or
+# from a plain MySQL dump of one.
+
+from datetime import datetime
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from instrument import stats
+
+
+class Trac(object):
+    """The Trac database, shared by the ticket and the wiki migration.
+
+    The database is only read: the connection is made query only, and
+    memory maps up to mmap_bytes of the file besides a page cache of
+    cache_bytes.
+    """
+    # We don't have a way to close (potentially nested) cursors
+
+    # Added to the copy made with index_copy, for the queries of TicketFilter
+    # and covering the ordered scans of ticket_change and wiki, so these read
+    # the index alone instead of looking up every row in the table.
+    INDEXES = [
+        'CREATE INDEX IF NOT EXISTS migrate_ticket_component_idx ON ticket (component, id)',
+        'CREATE INDEX IF NOT EXISTS migrate_ticket_status_idx ON ticket (status, id)',
+        'CREATE INDEX IF NOT EXISTS migrate_ticket_changetime_idx ON ticket (changetime)',
+        'CREATE INDEX IF NOT EXISTS migrate_ticket_change_idx '
+        'ON ticket_change (ticket, time, field, author, oldvalue, newvalue)',
+        'CREATE INDEX IF NOT EXISTS migrate_wiki_idx '
+        'ON wiki (time, name, version, author, ipnr, comment, readonly, text)',
+    ]
+
+    def __init__(self, trac_db_path, index_copy=False, cache_bytes=64 << 20, mmap_bytes=256 << 20):
+        """Open the Trac database.
+
+        With index_copy, a temporary copy of it is opened instead and
+        INDEXES are added to that, leaving the original untouched.
+        """
+        self.trac_db_path = trac_db_path
+        self.copy_path = None
+        if not os.path.isfile(trac_db_path):
+            # sqlite3 would create an empty database
+            raise RuntimeError("Could not open trac db=%s e=no such file" % trac_db_path)
+        if index_copy:
+            fd, self.copy_path = tempfile.mkstemp(suffix='.db', prefix='trac-')
+            os.close(fd)
+            logging.info("Copying {0} to {1} to index it...".format(trac_db_path, self.copy_path))
+            shutil.copyfile(trac_db_path, self.copy_path)
+        try:
+            self.conn = sqlite3.connect(self.copy_path or self.trac_db_path)
+        except sqlite3.OperationalError, e:
+            raise RuntimeError("Could not open trac db=%s e=%s" % (
+                    self.trac_db_path, e))
+        if index_copy:
+            with stats.timer('index'):
+                for statement in self.INDEXES:
+                    self.conn.execute(statement)
+                self.conn.execute('ANALYZE')
+                self.conn.commit()
+        self.conn.execute('PRAGMA query_only = ON')
+        self.conn.execute('PRAGMA cache_size = -%d' % (cache_bytes >> 10))
+        self.conn.execute('PRAGMA mmap_size = %d' % mmap_bytes)
+
+    def sql(self, sql_query, params=()):
+        """Create a new connection, send the SQL query, return response.
+        We need unique cursors so queries in context of others work.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(sql_query, params)
+        return cursor
+
+    def ticket_ids(self, selection=None):
+        """Return the ids of the tickets matching a TicketFilter, in order."""
+        condition, params = (selection or TicketFilter()).sql()
+        return [tid for (tid,) in self.sql('SELECT id FROM ticket WHERE %s ORDER BY id' % condition, params)]
+
+    def tickets_with_changes(self, columns, history=True, selection=None):
+        """Yield (ticket row, changes) pairs in ticket id order.
+
+        The first column must be the ticket id.  Changes are
+        (time, author, comment, [(field, oldvalue, newvalue)]) tuples in
+        time order, one for all ticket_change rows of a ticket with the same
+        time; comment is None if there is none.  Without history only the
+        comments are read and the field lists stay empty.  Only the tickets
+        matching selection, a TicketFilter, are read.
+
+        Tickets and changes are read with two ordered scans that are merged
+        as they go, so ticket_change is scanned once instead of once per
+        ticket.
+        """
+        selection = selection or TicketFilter()
+        condition, params = selection.sql()
+        tickets = self.sql('SELECT %s FROM ticket WHERE %s ORDER BY id' % (', '.join(columns), condition), params)
+        conditions, change_params = selection.id_range('ticket')
+        if not history:
+            conditions.append('field = ?')
+            change_params.append('comment')
+        attributes, attribute_params = selection.attributes()
+        if attributes:
+            conditions.append('ticket IN (SELECT id FROM ticket WHERE %s)' % ' AND '.join(attributes))
+            change_params += attribute_params
+        changes = self.sql('SELECT ticket, time, author, field, oldvalue, newvalue FROM ticket_change '
+                           'WHERE %s ORDER BY ticket, time' % (' AND '.join(conditions) or '1'), change_params)
+        return merge_changes(tickets, changes)
+
+    def enums(self):
+        """Return the (type, name, value) rows of the enum table."""
+        return self.sql('SELECT type, name, value FROM enum')
+
+    def milestones(self):
+        """Return the (name, description, due, completed) rows of the milestones."""
+        return self.sql('SELECT name, description, due, completed FROM milestone')
+
+    def ticket_usernames(self):
+        """Return the set of usernames that appear in tickets and their changes."""
+        return set(username for (username,) in self.sql(
+            'SELECT reporter FROM ticket UNION SELECT owner FROM ticket '
+            'UNION SELECT author FROM ticket_change '
+            'UNION SELECT oldvalue FROM ticket_change WHERE field IN (?, ?) '
+            'UNION SELECT newvalue FROM ticket_change WHERE field IN (?, ?)',
+            ('owner', 'reporter') * 2) if username)
+
+    def wiki_usernames(self):
+        """Return the set of authors of wiki page versions."""
+        return set(author for (author,) in self.sql('SELECT DISTINCT author FROM wiki') if author)
+
+    def wiki_versions(self, after=None):
+        """Return the rows of the page versions in (time, name, version) order.
+
+        With after, a (time, name, version) key, only the versions after it.
+        """
+        columns = 'SELECT name,version,time,author,ipnr,text,comment,readonly FROM wiki '
+        order = 'ORDER BY time, name, version'
+        if after is None:
+            return self.sql(columns + order)
+        time_, name, version = after
+        return self.sql(columns + 'WHERE time > ? OR (time = ? AND (name > ? OR (name = ? AND version > ?))) ' + order,
+                        (time_, time_, name, name, version))
+
+    def attachments(self, type_):
+        """Return the (type, id, filename, size) rows of the attachments of one parent type."""
+        return self.sql('SELECT type, id, filename, size FROM attachment WHERE type=?', (type_,))
+
+    def close(self):
+        self.conn.close()
+        if self.copy_path:
+            os.remove(self.copy_path)
+
+
+def merge_changes(tickets, changes):
+    """Yield (ticket row, changes) pairs; see Trac.tickets_with_changes.
+
+    tickets are rows starting with the id in id order, changes
+    (ticket, time, author, field, oldvalue, newvalue) rows in
+    (ticket, time) order.
+    """
+    changes = iter(changes)
+    pending = next(changes, None)
+    for row in tickets:
+        tid = row[0]
+        ticket_changes = []
+        while pending is not None and pending[0] <= tid:
+            ticket, time, author, field, oldvalue, newvalue = pending
+            if ticket == tid:
+                if not ticket_changes or ticket_changes[-1][0] != time:
+                    ticket_changes.append([time, author, None, []])
+                if field == 'comment':
+                    ticket_changes[-1][2] = newvalue
+                else:
+                    ticket_changes[-1][3].append((field, oldvalue, newvalue))
+            pending = next(changes, None)
+        yield row, ticket_changes
+
+
+class TicketFilter(object):
+    """Which tickets to migrate, as conditions for SQL queries.
+
+    Any of component, the id range first_id to last_id (both included),
+    the statuses and the changetime window changed_after to changed_before
+    (in seconds since the epoch) may be given.
+    """
+
+    def __init__(self, component=None, first_id=None, last_id=None, statuses=None,
+                 changed_after=None, changed_before=None):
+        self.component = component
+        self.first_id = first_id
+        self.last_id = last_id
+        self.statuses = statuses
+        self.changed_after = changed_after
+        self.changed_before = changed_before
+
+    def narrow(self, first_id, last_id):
+        """Return a copy that is further restricted to the ids first_id to last_id."""
+        if self.first_id is not None:
+            first_id = max(first_id, self.first_id)
+        if self.last_id is not None:
+            last_id = min(last_id, self.last_id)
+        return TicketFilter(self.component, first_id, last_id, self.statuses,
+                            self.changed_after, self.changed_before)
+
+    def id_range(self, column='id'):
+        """Return ([condition], [param]) restricting column to the id range."""
+        conditions, params = [], []
+        if self.first_id is not None:
+            conditions.append('%s >= ?' % column)
+            params.append(self.first_id)
+        if self.last_id is not None:
+            conditions.append('%s <= ?' % column)
+            params.append(self.last_id)
+        return conditions, params
+
+    def attributes(self):
+        """Return ([condition], [param]) for the conditions on other ticket columns."""
+        conditions, params = [], []
+        if self.component is not None:
+            conditions.append('component = ?')
+            params.append(self.component)
+        if self.statuses:
+            conditions.append('status IN (%s)' % ', '.join('?' * len(self.statuses)))
+            params.extend(self.statuses)
+        if self.changed_after is not None:
+            conditions.append('changetime >= ?')
+            params.append(self.changed_after)
+        if self.changed_before is not None:
+            conditions.append('changetime < ?')
+            params.append(self.changed_before)
+        return conditions, params
+
+    def matches(self, ticket):
+        """Whether a ticket, a {column: value} dict, is selected."""
+        tid = ticket['id']
+        if (self.first_id is not None and tid < self.first_id) or (self.last_id is not None and tid > self.last_id):
+            return False
+        if self.component is not None and ticket['component'] != self.component:
+            return False
+        if self.statuses and ticket['status'] not in self.statuses:
+            return False
+        if self.changed_after is not None and not ticket['changetime'] >= self.changed_after:
+            return False
+        if self.changed_before is not None and not ticket['changetime'] < self.changed_before:
+            return False
+        return True
+
+    def sql(self):
+        """Return (condition, params) for a WHERE clause on the ticket table."""
+        conditions, params = self.id_range()
+        attributes, attribute_params = self.attributes()
+        return ' AND '.join(conditions + attributes) or '1', params + attribute_params
+
+
+def _size(row):
+    """Rough size of a row in memory, for TracDump._ordered."""
+    return 64 + sum(len(value) for value in row if isinstance(value, basestring))
+
+
+class TracDump(object):
+    """The Trac tables of a plain MySQL dump, see mysqldump.py.
+
+    Offers the methods of Trac that the migration uses, without importing
+    the dump into a database.  Tables are streamed; a table that was not
+    dumped in the order a method needs is sorted in windows of at most
+    window_bytes of rows, reading the table once per window.
+    """
+
+    def __init__(self, dump_path, window_bytes=64 << 20):
+        from mysqldump import MysqlDump
+        self.trac_db_path = dump_path
+        self.window_bytes = window_bytes
+        with stats.timer('index'):
+            self.dump = MysqlDump(dump_path)
+
+    def _rows(self, table, columns):
+        """Yield the given columns of the rows of table as tuples."""
+        if not self.dump.has_table(table):
+            return
+        names = self.dump.columns[table]
+        index = [names.index(column) for column in columns]
+        for row in self.dump.rows(table):
+            yield tuple(row[i] for i in index)
+
+    def _ordered(self, rows, key):
+        """Yield the rows of rows(), a function returning an iterable, ordered by key(row).
+
+        A first pass checks the order and notes the key and size of each
+        row; rows that are in order already are streamed by a second pass.
+        Otherwise every window rereads and parses the whole table to pick
+        its rows, so a table of n bytes is read about n / window_bytes + 1
+        times in all.  Row offsets are not kept instead, as seeking back in
+        a gzip compressed dump means decompressing it again from the start.
+        """
+        keys = []
+        in_order = True
+        for row in rows():
+            k = key(row)
+            if keys and k < keys[-1][0]:
+                in_order = False
+            keys.append((k, _size(row)))
+        if in_order:
+            for row in rows():
+                yield row
+            return
+        keys.sort()
+        start = total = 0
+        for i, (k, size) in enumerate(keys):
+            total += size
+            # Rows with the same key stay in the same window
+            if i + 1 == len(keys) or (total >= self.window_bytes and keys[i + 1][0] != k):
+                first, last = keys[start][0], k
+                window = [row for row in rows() if first <= key(row) <= last]
+                window.sort(key=key)
+                for row in window:
+                    yield row
+                start, total = i + 1, 0
+
+    def ticket_ids(self, selection=None):
+        """Return the ids of the tickets matching a TicketFilter, in order."""
+        selection = selection or TicketFilter()
+        columns = self.dump.columns.get('ticket', [])
+        return sorted(row[0] for row in self._rows('ticket', ['id'] + columns)
+                      if selection.matches(dict(zip(columns, row[1:]))))
+
+    def tickets_with_changes(self, columns, history=True, selection=None):
+        """Yield (ticket row, changes) pairs in ticket id order, see Trac.tickets_with_changes."""
+        ids = set(self.ticket_ids(selection))
+        tickets = lambda: (row for row in self._rows('ticket', columns) if row[0] in ids)
+        changes = lambda: (row for row in self._rows('ticket_change', ['ticket', 'time', 'author', 'field',
+                                                                       'oldvalue', 'newvalue'])
+                           if row[0] in ids and (history or row[3] == 'comment'))
+        # Changes made at once are ordered like the (ticket, time, field) primary key
+        return merge_changes(self._ordered(tickets, key=lambda row: row[0]),
+                             self._ordered(changes, key=lambda row: (row[0], row[1], row[3])))
+
+    def enums(self):
+        return self._rows('enum', ['type', 'name', 'value'])
+
+    def milestones(self):
+        return self._rows('milestone', ['name', 'description', 'due', 'completed'])
+
+    def ticket_usernames(self):
+        usernames = set()
+        for reporter, owner in self._rows('ticket', ['reporter', 'owner']):
+            usernames.update((reporter, owner))
+        for author, field, oldvalue, newvalue in self._rows('ticket_change', ['author', 'field', 'oldvalue', 'newvalue']):
+            usernames.add(author)
+            if field in ('owner', 'reporter'):
+                usernames.update((oldvalue, newvalue))
+        usernames.discard(None)
+        usernames.discard(u'')
+        return usernames
+
+    def wiki_usernames(self):
+        return set(author for (author,) in self._rows('wiki', ['author']) if author)
+
+    def wiki_versions(self, after=None):
+        columns = ['name', 'version', 'time', 'author', 'ipnr', 'text', 'comment', 'readonly']
+        key = lambda row: (row[2], row[0], row[1])
+        versions = lambda: (row for row in self._rows('wiki', columns) if after is None or key(row) > after)
+        return self._ordered(versions, key)
+
+    def attachments(self, type_):
+        return (row for row in self._rows('attachment', ['type', 'id', 'filename', 'size']) if row[0] == type_)
+
+    def close(self):
+        pass
+
+
+def open_trac(path, index_copy=False, cache_bytes=64 << 20, mmap_bytes=256 << 20):
+    """Return a Trac for an SQLite database, or a TracDump for a .sql or .sql.gz MySQL dump."""
+    if path.endswith('.sql') or path.endswith('.sql.gz'):
+        if index_copy:
+            logging.warn('A MySQL dump is read as it is; ignoring --index-copy')
+        return TracDump(path)
+    return Trac(path, index_copy=index_copy, cache_bytes=cache_bytes, mmap_bytes=mmap_bytes)
+
+
+def epoch_to_iso(x):
+    iso_ts = datetime.fromtimestamp(x).isoformat()
+    return iso_ts
+
+
+def parse_date(text):
+    """Seconds since the epoch of a YYYY-MM-DD[THH:MM[:SS]] local time."""
+    for format_ in ('%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return int(time.mktime(time.strptime(text, format_)))
+        except ValueError:
+            pass
+    raise ValueError('Not a date: "%s"' % text)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# Migrate the Trac wiki into the git repository of a GitHub wiki, one commit
+# per page version.
+
+import codecs
+import logging
+import os
+from subprocess import Popen
+
+from fastimport import git_output
+from instrument import stats, utf8_size
+from parallel import ordered_map
+from trac import epoch_to_iso
+from wikiformat import WikiPageFormatConverter
+from wikistate import WikiState
+
+convert_wikiformat = WikiPageFormatConverter()
+
+# Trac's own pages, which are not migrated
+SKIPPED_PAGES = ["CamelCase","InterMapTxt","InterTrac","InterWiki","PageTemplates","RecentChanges","SandBox","TitleIndex"]
+
+class PageConverter(object):
+    """Turn a wiki row into the file and commit message of a git commit.
+
+    Instances only hold the lookup tables, so they can be run in worker
+    processes (see parallel.ordered_map).
+    """
+
+    def __init__(self, author_mapping, rev_mapping, attachments=None, ticket_mapping=None):
+        self.author_mapping = author_mapping
+        self.rev_mapping = rev_mapping
+        self.attachments = attachments
+        self.ticket_mapping = ticket_mapping
+
+    def __call__(self, row):
+        """Return (row key, page name, author, content, message); name is None for a skipped page."""
+        name,version,time,author,ipnr,text,comment,readonly = row
+        key = (time, name, version)
+        # Attachments belong to the page under its Trac name
+        page_attachments = self.attachments.bind('wiki', name) if self.attachments is not None else None
+        if name=="WikiStart": name="Home"
+        if name.startswith("Trac") or name.startswith("Wiki") or name in SKIPPED_PAGES:
+            return key, None, None, None, None
+        if comment is None: comment=""
+        if text is None: text=""
+        with stats.timer('convert') as measurement:
+            content = convert_wikiformat(text,rev_mapping=self.rev_mapping,mainpage=name=="Home",attachments=page_attachments,
+                                         ticket_mapping=self.ticket_mapping)
+            message = convert_wikiformat(comment,rev_mapping=self.rev_mapping,ticket_mapping=self.ticket_mapping)
+            measurement.bytes = utf8_size(content) + utf8_size(message)
+        return key, name, self.author_mapping(author), content, message
+
+def migrate(options, trac, author_mapping, rev_mapping, wiki_repo_path, cache=None, ticket_mapping=None):
+    """Commit the page versions not migrated yet to the wiki repository.
+
+    With a ticket_mapping from the ticket migration, ticket references are
+    rewritten to the issues like in tickets; otherwise they are left as they are.
+    """
+    global convert_wikiformat
+    unmapped = author_mapping.resolve(trac.wiki_usernames(), field="name")
+    if unmapped:
+      logging.warn(u'{0} Trac users are not in the authors file and become "None": {1}'.format(
+          len(unmapped), u', '.join(unmapped)))
+
+    if cache is not None:
+      from convcache import CachedConverter
+      # Used by PageConverter, also in worker processes
+      convert_wikiformat = CachedConverter(WikiPageFormatConverter(), cache)
+
+    # GitHub wikis have no attachments: the files are copied to a directory
+    # that is published at --attachments-url, and linked from there.
+    attachments = None
+    if options.trac_env:
+      from attachments import copy_attachments
+      logging.info("Copying wiki attachments to {0}...".format(options.attachments_dir))
+      attachments = copy_attachments(trac.attachments('wiki'), options.trac_env, options.attachments_dir,
+                                     options.attachments_url, workers=options.attachment_workers)
+
+    # Continue after the page version migrated last
+    state_file = options.state_file
+    if state_file is None:
+      git_dir = git_output(wiki_repo_path, 'rev-parse', '--git-dir')
+      if git_dir is None:
+        raise RuntimeError('{0} is not a git repository'.format(wiki_repo_path))
+      state_file = os.path.join(wiki_repo_path, git_dir, 'trac-wiki-state.json')
+    state = WikiState(state_file)
+    after = None if options.from_start else state.last
+    if after:
+      logging.info(u"Migrating the page versions after version {1} of {2} at {0}".format(epoch_to_iso(after[0]), after[2], after[1]))
+
+    fast_import = None
+    if options.fast_import:
+      from fastimport import FastImport
+      fast_import = FastImport(wiki_repo_path)
+
+    # Rows are read here, converted by --jobs workers and committed here
+    # in their original order, so conversion overlaps the commits.
+    convert_page = PageConverter(author_mapping, rev_mapping, attachments, ticket_mapping)
+    versions = trac.wiki_versions(after)
+    versions = stats.iterate('read', versions, size=lambda row: utf8_size(row[5]))
+    last = None
+    for last, name, author, content, message in ordered_map(convert_page, versions, jobs=options.jobs):
+      if name is None: continue
+      logging.info(u"Page {0}, version {1}".format(name, last[2]))
+      time = last[0]
+      with stats.timer('commit', nbytes=utf8_size(content)):
+        if fast_import:
+          fast_import.commit(name + '.md', content, author['name'], author['mail'], time, message)
+        else:
+          with codecs.open(wiki_repo_path + '/' + name + '.md','w','utf-8') as out:
+            out.write(content)
+          p=Popen(['git','add',name + '.md'],cwd=wiki_repo_path)
+          p.wait()
+          p=Popen(['git','commit','--allow-empty-message','--author="'+author['name']+' <'+ author['mail'] +'>"','--date='+epoch_to_iso(time),'-m',message],cwd=wiki_repo_path)
+          p.wait()
+          state.save(*last)
+
+    if fast_import:
+      with stats.timer('commit', items=0):
+        fast_import.close()
+    # Also covers the skipped pages after the last commit
+    if last:
+      state.save(*last)
+    logging.info("Migrated the wiki up to {0}".format(epoch_to_iso(state.last[0]) if state.last else "the start"))
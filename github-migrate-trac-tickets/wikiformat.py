@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# Convert Trac wiki markup to GitHub flavoured Markdown.
+#
+# Both trac-tickets-to-gh.py and wiki-to-gh.py used to carry their own copy of
+# convert_wikiformat, each running a dozen uncompiled re.sub calls per line.
+# The converters below compile every pattern once, walk the text a single time
+# splitting it into preformatted and prose lines, and only run the inline
+# substitutions on prose lines that contain markup at all.  The output is
+# identical to the old per-script functions.
+
+import re
+
+# Bump whenever the output of a converter changes, so cached conversions
+# made by an older version are not reused.
+VERSION = 1
+
+_BLOCK_OPEN = u'{{{'
+_BLOCK_CLOSE = u'}}}'
+
+# Shared inline patterns
+_RX_HTTP_LINK = re.compile("\[(http.*?)\]")
+_RX_SOURCE_LINK = re.compile("source:/trunk/(?P<C>[^@#\\b]*)(@(?P<R>\d+))?(#L(?P<L>[\d-]+))?")
+_RX_SHEBANG = re.compile("```\n#!(.*)")
+
+# Anything that may start a revision link, see RevisionMapping.rx_revlink.
+_REV_TRIGGER = r'\[|(?:^|\s)r[0-9a-f]|ommit [0-9a-f]|evision [0-9a-f]'
+# Anything that may start a ticket reference or an attachment link, see
+# TicketMapping.rx_ticket_ref and BoundAttachments.rx_link.
+_TICKET_TRIGGER = r'#\d|ticket:\d|attachment:'
+
+
+def _unescape_code(m):
+    s = m.group(1)
+    s = s.replace('\\>', '>')
+    s = s.replace('\\<', '<')
+    return "`" + s + "`"
+
+
+class WikiFormatConverter(object):
+    """Convert Trac wiki text to Markdown.
+
+    Subclasses implement the line level rules of one flavour in
+    _strip_line and _convert_line, which leave lines unchanged here; this
+    class handles the block structure.
+    Instances are callable like the old convert_wikiformat function.
+    """
+    name = None
+
+    # Lines not matching this are left alone by _convert_line; with a
+    # ticket mapping or attachments, lines not matching rx_markup_refs.
+    rx_markup = None
+    rx_markup_refs = None
+
+    def __call__(self, text, rev_mapping=None, title=False, mainpage=False, ticket_mapping=None,
+                 attachments=None):
+        pieces = []
+        in_pre = False
+        in_pre_trigger = False
+        if '\\' in text:
+            text = text.replace("\\r", "")
+            text = text.replace('\\"', '"')
+        if ticket_mapping is None and attachments is None:
+            rx_markup = self.rx_markup
+        else:
+            rx_markup = self.rx_markup_refs
+        for line in text.splitlines():
+            line = self._strip_line(line)
+            if line.startswith(u'=') and not in_pre:
+                depth = len(line.split(u' ')[0])
+                line = u'#' * depth + line.strip(u'=')
+            elif line.startswith(_BLOCK_OPEN) and not '}}' in line:
+                content = line.lstrip('{')
+                line = "```" + ("\n" if len(content) != 0 else "") + content
+                in_pre = True
+            elif line.endswith(_BLOCK_CLOSE) and not _BLOCK_OPEN in line:
+                content = line.rstrip('}')
+                line = u'' + content + ("\n" if len(content) != 0 else "") + "```"
+                in_pre_trigger = True
+            if in_pre:
+                line = line.replace('\\\\', '\\')
+            elif rx_markup.search(line):
+                links = None
+                if attachments is not None:
+                    line, links = attachments.extract(line)
+                line = self._convert_line(line, rev_mapping, title, mainpage, ticket_mapping)
+                if links:
+                    line = attachments.restore(line, links)
+            if in_pre_trigger:
+                in_pre = False
+                in_pre_trigger = False
+            pieces.append(line)
+
+        result = u'\n'.join(pieces)
+        if '#!' in result:
+            result = _RX_SHEBANG.sub(r"```\1", result)
+        return result
+
+    def _strip_line(self, line):
+        return line
+
+    def _convert_line(self, line, rev_mapping, title, mainpage, ticket_mapping):
+        return line
+
+    @staticmethod
+    def _source_link(line, rev_mapping):
+        def repl(m):
+            if m.group("R") is not None and rev_mapping is None:
+                # Without a revision mapping there is no commit to link to
+                return m.group(0)
+            branch = "master" if m.group("R") is None else rev_mapping.convert("[" + m.group("R") + "]")
+            suffix = "" if m.group("L") is None else "#L" + m.group("L")
+            return "[" + m.group("C") + "](/casadi/casadi/blob/" + branch + "/" + m.group("C") + suffix + ")"
+        return _RX_SOURCE_LINK.sub(repl, line)
+
+
+class TicketFormatConverter(WikiFormatConverter):
+    """Markup rules used for ticket summaries, descriptions and comments."""
+    name = 'ticket'
+
+    rx_markup = re.compile(r'[<>{]|source:/trunk/|' + _REV_TRIGGER)
+    rx_markup_refs = re.compile(r'[<>{]|source:/trunk/|' + _REV_TRIGGER + '|' + _TICKET_TRIGGER)
+    rx_link = re.compile("\[([^\] ]*?) ([^\]]*?)\]")
+    rx_wiki_link = re.compile("\[wiki:(.*?)\]")
+    rx_inline_code = re.compile("{{{(.*?)}}}?")
+
+    def _strip_line(self, line):
+        return line.strip()
+
+    def _convert_line(self, line, rev_mapping, title, mainpage, ticket_mapping):
+        if not title:
+            line = line.replace('>', '\\>')
+            line = line.replace('<', '\\<')
+        if ticket_mapping is not None:
+            line = ticket_mapping.convert(line)
+        if rev_mapping is not None:
+            line = rev_mapping.convert(line)
+        if '[' in line:
+            line = self.rx_link.sub(r"[\2](\1)", line)
+            line = _RX_HTTP_LINK.sub(r"\1", line)
+            line = self.rx_wiki_link.sub(r"[\1](/casadi/casadi/\1)", line)
+        if 'source:' in line:
+            line = self._source_link(line, rev_mapping)
+        if '{{{' in line:
+            line = self.rx_inline_code.sub(_unescape_code, line)
+        if '[[br]]' in line:
+            line = line.replace('[[br]]', '<br>')
+        return line
+
+
+class WikiPageFormatConverter(WikiFormatConverter):
+    """Markup rules used for wiki pages and their commit messages."""
+    name = 'wiki'
+
+    rx_markup = re.compile(r"[<>{`]|''|::$|\^    \*|source:/trunk/|" + _REV_TRIGGER)
+    rx_markup_refs = re.compile(r"[<>{`]|''|::$|\^    \*|source:/trunk/|" + _REV_TRIGGER + '|' + _TICKET_TRIGGER)
+    rx_indent = re.compile("^ *(\w)")
+    rx_wiki_label_link = re.compile("\[wiki:([^\] ]*?) ([^\]]*?)\]")
+    rx_wiki_link = re.compile("\[wiki:(.*?)\]")
+    rx_http_label_link = re.compile("\[(http[^\] ]*?) ([^\]]*?)\]")
+    rx_image = re.compile("\[\[Image\((.*?)\)\]\]")
+    rx_inline_code = re.compile("{{{(.*?)}}}?")
+    rx_code = re.compile("`(.*?)`")
+    rx_emphasis = [
+        (re.compile("''' *"), '**'),
+        (re.compile(" *'''"), '**'),
+        (re.compile(" *''"), '*'),
+        (re.compile("'' *"), '*'),
+    ]
+
+    def _strip_line(self, line):
+        if line.startswith(' '):
+            line = self.rx_indent.sub(r"\1", line)
+        return line
+
+    def _convert_line(self, line, rev_mapping, title, mainpage, ticket_mapping):
+        line = line.replace('^    *', ' *')
+        if not title:
+            line = line.replace('>', '\\>')
+            line = line.replace('<', '\\<')
+        if ticket_mapping is not None:
+            line = ticket_mapping.convert(line)
+        if rev_mapping is not None:
+            line = rev_mapping.convert(line)
+        if '[' in line:
+            if mainpage:
+                line = self.rx_wiki_label_link.sub(r"[\2](wiki/\1)", line)
+            else:
+                line = self.rx_wiki_label_link.sub(r"[\2](\1)", line)
+            line = self.rx_wiki_link.sub(r"[[\1]]", line)
+            line = self.rx_http_label_link.sub(r"[\2](\1)", line)
+            line = _RX_HTTP_LINK.sub(r"\1", line)
+            line = self.rx_image.sub(r"![](\1)<br/>", line)
+        if line.endswith("::"):
+            line = line[:-1]
+        if 'source:' in line:
+            line = self._source_link(line, rev_mapping)
+        if '{{{' in line:
+            line = self.rx_inline_code.sub(r"`\1`", line)
+        if '`' in line:
+            line = self.rx_code.sub(_unescape_code, line)
+        if '[[' in line:
+            line = line.replace('[[br]]', '<br>')
+            line = line.replace('[[BR]]', '<br>')
+        if "''" in line:
+            for rx, repl in self.rx_emphasis:
+                line = rx.sub(repl, line)
+        return line
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Remember which wiki page version was migrated last, so that a later run of
+# wiki-to-gh.py only migrates the versions saved in Trac since then.
+
+import json
+import os
+
+
+class WikiState(object):
+    """The (time, name, version) of the last migrated page version, in a json file.
+
+    Page versions are migrated in (time, name, version) order, so every
+    version after that key is new.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last = None
+        if os.path.exists(path):
+            with open(path) as in_:
+                state = json.load(in_)
+            self.last = (state['time'], state['name'], state['version'])
+
+    def save(self, time, name, version):
+        """Record a migrated version; the file is replaced atomically."""
+        self.last = (time, name, version)
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as out:
+            json.dump({'time': time, 'name': name, 'version': version}, out)
+            out.flush()
+            os.fsync(out.fileno())
+        os.rename(temp, self.path)